@@ -0,0 +1,11 @@
+from django.urls import path
+
+from .async_views import (download_shopping_cart, ingredient_list,
+                          recipe_detail, recipe_list)
+
+urlpatterns = [
+    path('recipes/', recipe_list),
+    path('recipes/download_shopping_cart/', download_shopping_cart),
+    path('recipes/<int:pk>/', recipe_detail),
+    path('ingredients/', ingredient_list),
+]
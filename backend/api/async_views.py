@@ -0,0 +1,50 @@
+"""Асинхронные варианты горячих эндпоинтов чтения для ASGI.
+
+Django 3.2 не умеет асинхронный ORM, а синхронные представления под ASGI
+выполняются в одном общем потоке. Поэтому обёртка запускает обычное
+DRF-представление в пуле потоков (thread_sensitive=False): запросы к БД и
+сериализация идут параллельно, а цикл событий только отдаёт ответы
+медленным клиентам. Потоковые ответы (список покупок) перебирает
+foodgram.asgi_handler, тоже вне цикла событий.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .urls import router
+
+
+def _run_view(view, request, *args, **kwargs):
+    # у потоков пула свои соединения с БД, управляем ими как на запрос
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обёртка над синхронным представлением."""
+    run_view = sync_to_async(_run_view, thread_sensitive=False)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run_view(view, request, *args, **kwargs)
+    return wrapper
+
+
+# представления роутера: с initkwargs действий (renderer_classes,
+# permission_classes из @action), basename и detail, как в foodgram.urls
+router_views = {
+    pattern.name: pattern.callback for pattern in router.urls if pattern.name
+}
+
+recipe_list = async_view(router_views['recipe-list'])
+recipe_detail = async_view(router_views['recipe-detail'])
+download_shopping_cart = async_view(
+    router_views['recipe-download-shopping-cart'])
+ingredient_list = async_view(router_views['ingredient-list'])
@@ -0,0 +1,100 @@
+from copy import copy
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from foodgram.lru import LRUCache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+# токен -> Token с загруженным пользователем; локальная копия живёт
+# TOKEN_CACHE_LOCAL_TTL секунд, поэтому в других воркерах отзыв токена
+# виден не позже чем через это время
+local_tokens = LRUCache(
+    settings.TOKEN_CACHE_LOCAL_SIZE, timeout=settings.TOKEN_CACHE_LOCAL_TTL)
+
+LOCAL, SHARED, MISS = 'local', 'shared', 'miss'
+
+
+class TokenCacheStats:
+    """Счётчики попаданий кэша токенов в памяти процесса."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def count(self, result):
+        with self._lock:
+            self._counts[result] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys((LOCAL, SHARED, MISS), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+token_cache_stats = TokenCacheStats()
+
+
+def _token_key(key):
+    return f'auth_token:{key}'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД при тёплом кэше.
+
+    Токен ищется в памяти воркера, затем в общем кэше и только потом
+    в БД. Записи сбрасываются при удалении токена (выход, удаление
+    пользователя) и при сохранении пользователя (смена пароля,
+    is_active, профиля).
+    """
+
+    def authenticate_credentials(self, key):
+        token = local_tokens.get(key)
+        if token is not None:
+            token_cache_stats.count(LOCAL)
+        else:
+            token = cache.get(_token_key(key))
+            if token is not None:
+                token_cache_stats.count(SHARED)
+            else:
+                token_cache_stats.count(MISS)
+                # неверный или неактивный токен - исключение, не кэшируем
+                _, token = super().authenticate_credentials(key)
+                cache.set(_token_key(key), token, settings.TOKEN_CACHE_TTL)
+            local_tokens.set(key, token)
+        # копия: запрос может менять request.user, а экземпляр из памяти
+        # воркера общий для всех потоков
+        token = copy(token)
+        token.user = copy(token.user)
+        return token.user, token
+
+
+def invalidate_token(key):
+    # удаляем сразу и после коммита: параллельный запрос мог прочитать
+    # токен до коммита и успеть положить его в кэш
+    local_tokens.pop(key)
+    cache.delete(_token_key(key))
+    transaction.on_commit(lambda: cache.delete(_token_key(key)))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # вход обновляет только last_login, кэш от него не устаревает
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        invalidate_token(key)
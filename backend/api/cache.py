@@ -0,0 +1,120 @@
+from hashlib import md5
+
+from django.core.cache import cache
+from django.utils.http import parse_etags, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram.db_router import primary
+from recipes.versions import (INGREDIENTS, RECIPES, TAGS, get_version,
+                              get_versions, recipe_version_name)
+
+
+class ReferenceCacheMixin:
+    """Кэш ответов для справочников (теги, ингредиенты).
+
+    Ответ хранится в кэше по версии справочника и строке запроса, версия
+    меняется при любом сохранении или удалении записи. Клиент получает
+    ETag и при совпадении If-None-Match - ответ 304 без обращения к БД.
+    """
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        version = get_version(self.reference_name)
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        digest = md5(f'{request.path}?{query}'.encode()).hexdigest()
+        etag = f'"{self.reference_name}-{version}-{digest}"'
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache_key = f'reference:{self.reference_name}:{version}:{digest}'
+            data = cache.get(cache_key)
+            if data is None:
+                # кэш заполняется только с основной БД, см. primary()
+                with primary():
+                    response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(cache_key, response.data)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+ANONYMOUS_CACHE_HITS = 'anonymous_cache:hits'
+ANONYMOUS_CACHE_MISSES = 'anonymous_cache:misses'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_anonymous_cache_stats():
+    stats = cache.get_many([ANONYMOUS_CACHE_HITS, ANONYMOUS_CACHE_MISSES])
+    return {
+        'hits': stats.get(ANONYMOUS_CACHE_HITS, 0),
+        'misses': stats.get(ANONYMOUS_CACHE_MISSES, 0),
+    }
+
+
+class AnonymousRecipeCacheMixin:
+    """Кэш ответов списка и карточки рецепта для анонимных пользователей.
+
+    Для анонима is_favorited и is_in_shopping_cart всегда False, поэтому
+    ответ одинаков для всех. Ключ включает версию ленты (для списка) или
+    версии рецепта и справочников тегов и ингредиентов (для карточки),
+    их сбрасывают сигналы recipes.signals при изменении рецепта, его
+    тегов, ингредиентов или автора.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._anonymous_response(
+            (RECIPES,), super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._anonymous_response(
+            (recipe_version_name(
+                kwargs[self.lookup_url_kwarg or self.lookup_field]),
+             TAGS, INGREDIENTS),
+            super().retrieve, request, *args, **kwargs)
+
+    def _anonymous_response(self, version_names, handler, request,
+                            *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        version = '-'.join(map(str, get_versions(*version_names)))
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        # адреса картинок абсолютные, поэтому хост тоже часть ключа
+        digest = md5(
+            f'{request.get_host()}{request.path}?{query}'.encode()
+        ).hexdigest()
+        cache_key = f'anonymous:{version_names[0]}:{version}:{digest}'
+
+        data = cache.get(cache_key)
+        if data is not None:
+            _count(ANONYMOUS_CACHE_HITS)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(ANONYMOUS_CACHE_MISSES)
+        with primary():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -1,5 +1,8 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeTag,
+                            ShoppingCart, Tag)
+from recipes.search import search_recipes
 from rest_framework.filters import SearchFilter
 
 
@@ -13,26 +16,41 @@ class IngredientFilter(FilterSet):
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_tags(self, queryset, name, value):
+        # EXISTS вместо JOIN: рецепт с несколькими выбранными тегами
+        # не дублируется и не нужен DISTINCT
+        if not value:
+            return queryset
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag__in=value)))
+
+    def _filter_user_list(self, queryset, model, value):
+        # EXISTS, а не id__in по закэшированному множеству: у пользователя
+        # с тысячами рецептов в списке запрос рос бы на тысячи параметров
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return queryset
 
+    def filter_is_favorited(self, queryset, name, value):
+        return self._filter_user_list(queryset, Favorite, value)
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(shopping_cart__user=user)
-        return queryset
+        return self._filter_user_list(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
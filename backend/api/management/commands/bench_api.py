@@ -0,0 +1,125 @@
+from statistics import quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.models import Ingredient, ShoppingCart, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+# максимально допустимое число SQL-запросов на один вызов;
+# превышение означает регрессию (например, N+1) и роняет команду
+QUERY_BUDGETS = {
+    'recipes: список': 5,
+    'recipes: список по тегам': 6,
+    'recipes: список, авторизован': 8,
+    'recipes: избранное': 8,
+    'recipes: карточка': 4,
+    'users: подписки': 4,
+    'ingredients: поиск': 1,
+    'recipes: список покупок': 1,
+}
+
+
+class Command(BaseCommand):
+    help = ('Замер времени ответа и числа SQL-запросов основных '
+            'эндпоинтов API через тестовый клиент')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Сколько раз вызвать каждый эндпоинт')
+        parser.add_argument(
+            '--user-id', type=int,
+            help='Пользователь для авторизованных запросов, по умолчанию '
+                 'первый пользователь со списком покупок')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user_id'])
+        recipe_id = ShoppingCart.objects.filter(
+            user=user).values_list('recipe_id', flat=True).first()
+        tags = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient = Ingredient.objects.values_list('name', flat=True).first()
+
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.force_authenticate(user)
+        scenarios = (
+            ('recipes: список', anonymous, '/api/recipes/'),
+            ('recipes: список по тегам', anonymous,
+             f'/api/recipes/?{tags}'),
+            ('recipes: список, авторизован', authorized, '/api/recipes/'),
+            ('recipes: избранное', authorized,
+             '/api/recipes/?is_favorited=1'),
+            ('recipes: карточка', anonymous, f'/api/recipes/{recipe_id}/'),
+            ('users: подписки', authorized,
+             '/api/users/subscriptions/?recipes_limit=3'),
+            ('ingredients: поиск', anonymous,
+             f'/api/ingredients/?name={ingredient[:2]}'),
+            ('recipes: список покупок', authorized,
+             '/api/recipes/download_shopping_cart/'),
+        )
+
+        self.stdout.write(
+            f'{"эндпоинт":32} {"p50, мс":>8} {"p95, мс":>8} '
+            f'{"p99, мс":>8} {"запросы":>8} {"бюджет":>7}')
+        over_budget = []
+        for name, client, url in scenarios:
+            # тестовый клиент ходит на хост testserver
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                timings, queries = self.measure(
+                    client, url, options['repeat'])
+            p50, p95, p99 = self.percentiles(timings)
+            budget = QUERY_BUDGETS[name]
+            line = (f'{name:32} {p50:8.2f} {p95:8.2f} {p99:8.2f} '
+                    f'{queries:8} {budget:7}')
+            if queries > budget:
+                over_budget.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if over_budget:
+            raise CommandError(
+                'Превышен бюджет SQL-запросов: ' + ', '.join(over_budget))
+        self.stdout.write(self.style.SUCCESS('Бюджеты запросов соблюдены'))
+
+    @staticmethod
+    def get_user(user_id):
+        users = User.objects.all()
+        if user_id is not None:
+            users = users.filter(id=user_id)
+        else:
+            users = users.filter(shopping_cart__isnull=False)
+        user = users.first()
+        if user is None:
+            raise CommandError(
+                'Нет подходящего пользователя, сначала выполните '
+                'generate_data')
+        return user
+
+    @staticmethod
+    def measure(client, url, repeat):
+        """Время каждого вызова в мс и максимум SQL-запросов за вызов."""
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+            queries = max(queries, len(context))
+        return timings, queries
+
+    @staticmethod
+    def percentiles(timings):
+        if len(timings) < 2:
+            return timings * 3
+        points = quantiles(timings, n=100, method='inclusive')
+        return points[49], points[94], points[98]
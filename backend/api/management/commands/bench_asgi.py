@@ -0,0 +1,129 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter, sleep
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from foodgram.asgi_handler import StreamingASGIHandler
+from recipes.models import Ingredient, ShoppingCart
+from rest_framework.authtoken.models import Token
+
+# имя хоста для запросов в обход сервера
+HOST = 'testserver'
+
+
+class Command(BaseCommand):
+    help = ('Сравнение WSGI (синхронные представления) и ASGI '
+            '(api.async_views) при большом числе медленных клиентов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=400,
+            help='Всего запросов на каждый эндпоинт')
+        parser.add_argument(
+            '--concurrency', type=int, default=200,
+            help='Одновременных клиентов')
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Потоков WSGI-сервера (как у gunicorn --threads)')
+        parser.add_argument(
+            '--client-delay', type=float, default=20,
+            help='Задержка медленного клиента на каждый фрагмент ответа, мс')
+
+    def handle(self, *args, **options):
+        cart = ShoppingCart.objects.select_related('user').first()
+        ingredient = Ingredient.objects.values_list('name', flat=True).first()
+        if cart is None or ingredient is None:
+            raise CommandError('Сначала выполните generate_data')
+        token, _ = Token.objects.get_or_create(user=cart.user)
+        self.auth = f'Token {token.key}'
+        self.delay = options['client_delay'] / 1000
+
+        endpoints = (
+            ('recipes: список', '/api/recipes/', ''),
+            ('recipes: карточка', f'/api/recipes/{cart.recipe_id}/', ''),
+            ('ingredients: поиск', '/api/ingredients/',
+             urlencode({'name': ingredient[:2]})),
+            ('recipes: список покупок',
+             '/api/recipes/download_shopping_cart/', ''),
+        )
+        self.stdout.write(
+            f'{"эндпоинт":28} {"WSGI, зап/с":>12} {"ASGI, зап/с":>12}')
+        with override_settings(ALLOWED_HOSTS=[HOST]):
+            for name, path, query in endpoints:
+                with override_settings(ROOT_URLCONF='foodgram.urls'):
+                    wsgi = self.run_wsgi(path, query, options)
+                with override_settings(ROOT_URLCONF='foodgram.urls_async'):
+                    asgi = self.run_asgi(path, query, options)
+                self.stdout.write(f'{name:28} {wsgi:12.1f} {asgi:12.1f}')
+
+    def run_wsgi(self, path, query, options):
+        handler = WSGIHandler()
+
+        def request():
+            status = []
+            body = handler({
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query,
+                'SERVER_NAME': HOST,
+                'SERVER_PORT': '80',
+                'HTTP_AUTHORIZATION': self.auth,
+                'wsgi.input': BytesIO(),
+                'wsgi.url_scheme': 'http',
+            }, lambda code, headers: status.append(code))
+            # медленный клиент держит поток сервера, пока читает ответ
+            for _ in body:
+                sleep(self.delay)
+            body.close()
+            if not status[0].startswith('200'):
+                raise CommandError(f'{path}: ответ {status[0]}')
+
+        start = perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            for future in [pool.submit(request)
+                           for _ in range(options['requests'])]:
+                future.result()
+        return options['requests'] / (perf_counter() - start)
+
+    def run_asgi(self, path, query, options):
+        handler = StreamingASGIHandler()
+
+        async def request(semaphore):
+            async with semaphore:
+                status = []
+
+                async def receive():
+                    return {'type': 'http.request', 'body': b''}
+
+                async def send(message):
+                    if message['type'] == 'http.response.start':
+                        status.append(message['status'])
+                    else:
+                        # медленный клиент ждёт, не занимая поток
+                        await asyncio.sleep(self.delay)
+
+                await handler({
+                    'type': 'http',
+                    'method': 'GET',
+                    'path': path,
+                    'query_string': query.encode(),
+                    'headers': [
+                        (b'host', HOST.encode()),
+                        (b'authorization', self.auth.encode()),
+                    ],
+                }, receive, send)
+                if status[0] != 200:
+                    raise CommandError(f'{path}: ответ {status[0]}')
+
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            await asyncio.gather(*(
+                request(semaphore) for _ in range(options['requests'])))
+
+        start = perf_counter()
+        asyncio.run(run())
+        return options['requests'] / (perf_counter() - start)
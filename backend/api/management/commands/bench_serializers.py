@@ -0,0 +1,82 @@
+import json
+from statistics import median
+from time import perf_counter
+
+from api.representations import recipe_representations
+from api.serializers import RecipeSerializer
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from recipes.models import Recipe
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils.encoders import JSONEncoder
+from users.models import User
+
+
+def serializer_representations(recipe_ids, request):
+    """Те же рецепты через RecipeSerializer, как до быстрого пути."""
+    recipes = Recipe.objects.filter(id__in=recipe_ids).select_related(
+        'author').prefetch_related('tags', 'ingredient_list__ingredient')
+    recipes = {recipe.id: recipe for recipe in recipes}
+    return RecipeSerializer(
+        [recipes[pk] for pk in recipe_ids if pk in recipes],
+        many=True, context={'request': request}).data
+
+
+def as_json(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+class Command(BaseCommand):
+    help = ('Замер скорости быстрого чтения рецептов и RecipeSerializer; '
+            'совпадение ответов проверяют тесты api')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='Размер страницы рецептов')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз замерить каждый способ')
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        if not recipe_ids:
+            raise CommandError(
+                'Нет рецептов, сначала выполните generate_data')
+        limit = min(options['limit'], len(recipe_ids))
+        # с пользователем вычисляются и флаги избранного и подписок
+        user = User.objects.filter(subscriber__isnull=False).first()
+
+        # тестовая фабрика запросов ходит на хост testserver
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            page = recipe_ids[:limit]
+            request = self.make_request(user)
+            timings = {}
+            for name, build in (
+                    ('RecipeSerializer', serializer_representations),
+                    ('recipe_representations', recipe_representations)):
+                timings[name] = self.measure(
+                    build, page, request, options['repeat'])
+                self.stdout.write(
+                    f'{name:24} {timings[name]:8.2f} мс на {limit} рецептов')
+        speedup = (timings['RecipeSerializer']
+                   / timings['recipe_representations'])
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: {speedup:.1f}x'))
+
+    @staticmethod
+    def make_request(user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        if user is not None:
+            request.user = user
+        return request
+
+    @staticmethod
+    def measure(build, recipe_ids, request, repeat):
+        """Медиана времени одного вызова вместе с рендерингом JSON, мс."""
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            as_json(build(recipe_ids, request))
+            timings.append((perf_counter() - start) * 1000)
+        return median(timings)
@@ -0,0 +1,53 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from recipes.models import Recipe, Tag
+from rest_framework.test import APIRequestFactory
+
+from api.filters import RecipeFilter
+
+# индексы, которые должны попасть в план; на SQLite ограничение
+# unique_recipe_tag становится индексом sqlite_autoindex_*
+EXPECTED_INDEXES = {
+    'tags': ('unique_recipe_tag', 'recipe_tag_tag_recipe_idx',
+             'sqlite_autoindex_recipes_recipe_tags'),
+    'author': ('recipe_author_pub_date_idx',),
+}
+
+
+class Command(BaseCommand):
+    help = ('Проверяет через EXPLAIN, что фильтры ленты рецептов по тегам '
+            'и автору используют индексы и не дают дублей. Запускать на '
+            'базе с данными (generate_data): на пустых таблицах '
+            'планировщик Postgres выбирает полный просмотр')
+
+    def handle(self, *args, **options):
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        author = Recipe.objects.values_list('author_id', flat=True).first()
+        if len(slugs) < 2 or author is None:
+            raise CommandError('Нет данных: сначала выполните generate_data')
+
+        failures = []
+        for name, query in (
+                ('tags', f'tags={slugs[0]}&tags={slugs[1]}'),
+                ('author', f'author={author}')):
+            queryset = self.filter(query)
+            plan = queryset.explain()
+            self.stdout.write(f'{query}\n{plan}\n')
+            if not any(index in plan for index in EXPECTED_INDEXES[name]):
+                failures.append(f'{name}: индекс не используется')
+            ids = list(queryset.values_list('id', flat=True))
+            if len(ids) != len(set(ids)):
+                failures.append(f'{name}: рецепты повторяются')
+
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке'))
+
+    @staticmethod
+    def filter(query):
+        request = APIRequestFactory().get(f'/api/recipes/?{query}')
+        request.user = AnonymousUser()
+        return RecipeFilter(
+            QueryDict(query), queryset=Recipe.objects.all(), request=request
+        ).qs
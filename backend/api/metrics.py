@@ -0,0 +1,190 @@
+from bisect import bisect_left
+from contextlib import ExitStack
+from threading import Lock
+from time import perf_counter
+
+from django.db import connections
+
+from .authentication import token_cache_stats
+from .cache import get_anonymous_cache_stats
+
+# верхние границы корзин гистограммы времени ответа, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class ViewStats:
+    __slots__ = ('count', 'buckets', 'latency', 'queries', 'sql_time',
+                 'response_bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    """Метрики запросов по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._views = {}
+
+    def _stats(self, view):
+        if view not in self._views:
+            self._views[view] = ViewStats()
+        return self._views[view]
+
+    def observe(self, view, latency):
+        with self._lock:
+            stats = self._stats(view)
+            stats.count += 1
+            stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.latency += latency
+
+    def add(self, view, queries=0, sql_time=0.0, response_bytes=0):
+        with self._lock:
+            stats = self._stats(view)
+            stats.queries += queries
+            stats.sql_time += sql_time
+            stats.response_bytes += response_bytes
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def export(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            views = sorted(
+                (view, stats.count, list(stats.buckets), stats.latency,
+                 stats.queries, stats.sql_time, stats.response_bytes)
+                for view, stats in self._views.items())
+
+        lines = [
+            '# HELP foodgram_request_duration_seconds Время ответа.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        for view, count, buckets, latency, *_ in views:
+            cumulative = 0
+            for bound, hits in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += hits
+                lines.append(
+                    f'foodgram_request_duration_seconds_bucket'
+                    f'{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(
+                f'foodgram_request_duration_seconds_sum{{view="{view}"}} '
+                f'{latency}')
+            lines.append(
+                f'foodgram_request_duration_seconds_count{{view="{view}"}} '
+                f'{count}')
+
+        counters = (
+            ('foodgram_db_queries_total', 'Число SQL-запросов.', 4),
+            ('foodgram_db_query_duration_seconds_total',
+             'Суммарное время SQL-запросов.', 5),
+            ('foodgram_response_size_bytes_total', 'Объём ответов.', 6),
+        )
+        for name, help_text, position in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for row in views:
+                lines.append(f'{name}{{view="{row[0]}"}} {row[position]}')
+
+        for result, value in get_anonymous_cache_stats().items():
+            name = f'foodgram_anonymous_cache_{result}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+
+        name = 'foodgram_token_cache_requests_total'
+        lines.append(f'# HELP {name} Проверки токена: local и shared - '
+                     f'попадания в кэш, miss - запрос к БД.')
+        lines.append(f'# TYPE {name} counter')
+        for result, value in token_cache_stats.snapshot().items():
+            lines.append(f'{name}{{result="{result}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def view_name(request):
+    """Имя представления и действия, например RecipeViewSet.list."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    view_class = (getattr(func, 'cls', None)
+                  or getattr(func, 'view_class', None))
+    if view_class is None:
+        return func.__name__
+    actions = getattr(func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{view_class.__name__}.{action}'
+    return f'{view_class.__name__}.{request.method.lower()}'
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper: считает запросы и время в БД."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += perf_counter() - start
+            self.queries += 1
+
+
+def count_queries(counter):
+    """Подключает counter ко всем соединениям с БД."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(counter))
+    return stack
+
+
+class MetricsMiddleware:
+    """Собирает время ответа, число и время SQL-запросов, объём ответа.
+
+    Подключается настройкой METRICS_ENABLED, метрики отдаёт /api/metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = perf_counter()
+        with count_queries(counter):
+            response = self.get_response(request)
+        view = view_name(request)
+        registry.observe(view, perf_counter() - start)
+        registry.add(view, counter.queries, counter.sql_time)
+
+        if response.streaming:
+            # потоковые ответы читают БД уже во время отдачи
+            response.streaming_content = self.count_stream(
+                view, response.streaming_content)
+        else:
+            registry.add(view, response_bytes=len(response.content))
+        return response
+
+    @staticmethod
+    def count_stream(view, content):
+        counter = QueryCounter()
+        size = 0
+        try:
+            with count_queries(counter):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            registry.add(view, counter.queries, counter.sql_time, size)
@@ -0,0 +1,102 @@
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from recipes.feed import feed_recipe_ids
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class LimitPageNumberPagination(PageNumberPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+
+
+class RecipePagination(LimitPageNumberPagination):
+    """Постраничная выдача рецептов с опциональным режимом курсора.
+
+    С параметром ?cursor= лента листается по ключу (pub_date, id) без
+    COUNT(*) и OFFSET; пустой курсор означает первую страницу. Запросы
+    с page/limit обрабатываются как раньше.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-pub_date', '-id')
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            pub_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk))
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last)
+        )
+
+    @staticmethod
+    def encode_cursor(recipe):
+        position = f'{recipe.pub_date.isoformat()}|{recipe.id}'
+        return b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            pub_date, pk = b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class FeedPagination(RecipePagination):
+    """Лента подписок: всегда курсор, порядок страницы задаёт recipes.feed.
+
+    Переданный queryset нужен только чтобы загрузить рецепты страницы
+    со связанными данными.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        position = self.decode_cursor(cursor) if cursor else None
+
+        ids = feed_recipe_ids(request.user, position, page_size + 1)
+        self.has_next = len(ids) > page_size
+        ids = ids[:page_size]
+        recipes = queryset.in_bulk(ids)
+        results = [recipes[pk] for pk in ids if pk in recipes]
+        self.last = results[-1] if results else None
+        # рецепты страницы могли удалить между двумя запросами
+        self.has_next = self.has_next and self.last is not None
+        return results
@@ -0,0 +1,24 @@
+import json
+
+from rest_framework import renderers
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    """Рендерер для выгрузок в текстовом виде (?format=txt).
+
+    Сами выгрузки отдаются потоком, рендерер нужен для согласования
+    формата и для ответов с ошибками.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
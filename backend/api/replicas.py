@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_router import replica_reads
+
+
+def _sticky_key(user_id):
+    return f'db_sticky:{user_id}'
+
+
+def mark_write(user):
+    """После записи пользователь какое-то время читает с основной БД."""
+    if settings.DATABASE_REPLICAS and user.is_authenticated:
+        cache.set(
+            _sticky_key(user.id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return (user.is_authenticated
+            and cache.get(_sticky_key(user.id)) is not None)
+
+
+class ReplicaReadMixin:
+    """GET-запросы вьюсета читают данные с реплик БД.
+
+    Решение принимается после аутентификации: пользователь, недавно
+    что-то изменивший, читает с основной БД и видит свои изменения,
+    пока реплики их догоняют.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (settings.DATABASE_REPLICAS and request.method in SAFE_METHODS
+                and not is_sticky(request.user)):
+            self._replica_reads = replica_reads()
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        reads = self.__dict__.pop('_replica_reads', None)
+        if reads is not None:
+            reads.__exit__(None, None, None)
+        elif (request.method not in SAFE_METHODS
+              and response.status_code < 400):
+            mark_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,125 @@
+"""Быстрое чтение рецептов без полей сериализаторов DRF.
+
+RecipeSerializer для каждого рецепта обходит поля вложенных
+сериализаторов автора, ингредиентов и тегов; на странице из сотни
+рецептов это основная часть времени ответа. Здесь тот же JSON
+собирается обычными функциями из строк values(): рецепты с авторами,
+теги и ингредиенты - по одному запросу. Совпадение с RecipeSerializer
+проверяет RecipeRepresentationsTest в api/tests.py.
+"""
+from collections import defaultdict
+
+from django.http import Http404
+from recipes.membership import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS,
+                                get_member_ids)
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from rest_framework.response import Response
+from users.models import User
+
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+
+RECIPE_VALUES = ('id', 'name', 'image', 'text', 'cooking_time',
+                 'author__avatar') + tuple(
+    f'author__{field}' for field in AUTHOR_FIELDS)
+
+
+def _member_ids(request, kind):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    return get_member_ids(user.id, kind)
+
+
+def _file_url(storage, name, request):
+    # как FileField в DRF: абсолютный адрес, если есть запрос
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def _recipe_tags(recipe_ids):
+    tags = defaultdict(list)
+    # порядок тот же, что у Tag.Meta.ordering в prefetch тегов
+    for recipe_id, *values in RecipeTag.objects.filter(
+            recipe_id__in=recipe_ids).order_by('tag__name').values_list(
+            'recipe_id', *(f'tag__{field}' for field in TAG_FIELDS)):
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+    return tags
+
+
+def _recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    for recipe_id, amount, *values in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).order_by('id').values_list(
+            'recipe_id', 'amount',
+            *(f'ingredient__{field}' for field in INGREDIENT_FIELDS)):
+        ingredient = dict(zip(INGREDIENT_FIELDS, values))
+        ingredient['amount'] = amount
+        ingredients[recipe_id].append(ingredient)
+    return ingredients
+
+
+def recipe_representations(recipe_ids, request=None):
+    """Рецепты в виде RecipeSerializer, в порядке recipe_ids."""
+    recipe_ids = list(recipe_ids)
+    rows = {
+        row[0]: row for row in Recipe.objects.filter(
+            id__in=recipe_ids).order_by().values_list(*RECIPE_VALUES)
+    }
+    tags = _recipe_tags(recipe_ids)
+    ingredients = _recipe_ingredients(recipe_ids)
+    favorites = _member_ids(request, FAVORITES)
+    shopping_cart = _member_ids(request, SHOPPING_CART)
+    subscriptions = _member_ids(request, SUBSCRIPTIONS)
+    image_storage = Recipe._meta.get_field('image').storage
+    avatar_storage = User._meta.get_field('avatar').storage
+
+    representations = []
+    for recipe_id in recipe_ids:
+        if recipe_id not in rows:
+            continue
+        _, name, image, text, cooking_time, avatar, *author = rows[recipe_id]
+        author = dict(zip(AUTHOR_FIELDS, author))
+        author['is_subscribed'] = author['id'] in subscriptions
+        author['avatar'] = _file_url(avatar_storage, avatar, request)
+        representations.append({
+            'id': recipe_id,
+            'tags': tags[recipe_id],
+            'author': author,
+            'ingredients': ingredients[recipe_id],
+            'is_favorited': recipe_id in favorites,
+            'is_in_shopping_cart': recipe_id in shopping_cart,
+            'name': name,
+            'image': _file_url(image_storage, image, request),
+            'text': text,
+            'cooking_time': cooking_time,
+        })
+    return representations
+
+
+class RecipeRepresentationMixin:
+    """list и retrieve рецептов через recipe_representations.
+
+    Queryset представления нужен только для фильтров, пагинации
+    и проверки доступа, поэтому может выбирать одни ключи.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(recipe_representations(
+                queryset.values_list('id', flat=True), request))
+        return self.get_paginated_response(recipe_representations(
+            [recipe.id for recipe in page], request))
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        representations = recipe_representations([recipe.id], request)
+        # рецепт могли удалить между двумя запросами
+        if not representations:
+            raise Http404
+        return Response(representations[0])
@@ -1,22 +1,87 @@
 import base64
-from django.core.files.base import ContentFile
+import binascii
+import json
+import tempfile
+from collections import Counter
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import F, prefetch_related_objects
 from rest_framework import serializers
-from recipes.models import Ingredient, Tag, Recipe, RecipeIngredient, Favorite, ShoppingCart
+from recipes.membership import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS,
+                                get_member_ids)
+from recipes.models import (Ingredient, Tag, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart)
+from recipes.feed import fan_out
+from recipes.search import update_search_vectors
+from recipes.shopping_cart import recipe_ingredients_changed
+from recipes.versions import RECIPES, bump_version
 from users.models import User
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer as DjoserUserCreateSerializer
 
 
 class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для кодирования изображения в base64."""
+    """Кастомное поле для кодирования изображения в base64.
+
+    Строка декодируется частями во временный файл, размер изображения
+    ограничен настройкой IMAGE_UPLOAD_MAX_SIZE. Файлы из multipart/form-data
+    принимаются как есть с тем же ограничением.
+    """
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+        'invalid_base64': 'Некорректная строка base64.',
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode_to_file(imgstr, 'temp.' + ext)
+        elif getattr(data, 'size', 0) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('max_size', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
         return super().to_internal_value(data)
 
+    def base64_parts(self, imgstr):
+        """Части строки без пробельных символов, длиной кратной 4.
+
+        base64 в стиле MIME переносит строки, поэтому неполная четвёрка
+        символов в конце части переходит в начало следующей.
+        """
+        leftover = ''
+        for start in range(0, len(imgstr), self.chunk_size):
+            part = leftover + ''.join(
+                imgstr[start:start + self.chunk_size].split())
+            end = len(part) - len(part) % 4
+            leftover = part[end:]
+            yield part[:end]
+        if leftover:
+            # неполная четвёрка в конце строки - ошибка при декодировании
+            yield leftover
+
+    def decode_to_file(self, imgstr, name):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        file = File(
+            tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR),
+            name=name
+        )
+        error = None
+        try:
+            size = 0
+            for part in self.base64_parts(imgstr):
+                size += file.write(base64.b64decode(part))
+                if size > max_size:
+                    error = 'max_size'
+                    break
+        except binascii.Error:
+            error = 'invalid_base64'
+        if error:
+            file.close()
+            self.fail(error, max_size=max_size)
+        file.seek(0)
+        return file
+
 
 class UserAvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField()
@@ -26,7 +91,24 @@ class UserAvatarSerializer(serializers.ModelSerializer):
         fields = ('avatar',)
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class MemberIdsMixin:
+    """Проверка принадлежности объекта спискам текущего пользователя.
+
+    Множества id берутся из recipes.membership один раз на запрос
+    и запоминаются в контексте сериализатора.
+    """
+
+    def member_ids(self, kind):
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            return frozenset()
+        memo = self.context.setdefault('member_ids', {})
+        if kind not in memo:
+            memo[kind] = get_member_ids(request.user.id, kind)
+        return memo[kind]
+
+
+class CustomUserSerializer(MemberIdsMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -35,7 +117,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'avatar')
 
     def get_is_subscribed(self, obj):
-        return False
+        return obj.id in self.member_ids(SUBSCRIPTIONS)
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
@@ -47,10 +129,30 @@ class RecipeShortSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class ShoppingCartSerializer(serializers.ModelSerializer):
+    """Число порций рецепта в списке покупок.
+
+    portions обязательно при изменении; при добавлении рецепта
+    (partial=True) по умолчанию одна порция.
+    """
+
+    class Meta:
+        model = ShoppingCart
+        fields = ('portions',)
+        extra_kwargs = {'portions': {'required': True}}
+
+
+def get_recipes_limit(request):
+    """recipes_limit из запроса: неотрицательное число или None."""
+    try:
+        return max(int(request.query_params.get('recipes_limit')), 0)
+    except (ValueError, TypeError):
+        return None
+
+
 class SubscriptionSerializer(CustomUserSerializer):
     """Сериализатор подписки: выводит автора и список его рецептов."""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -58,15 +160,11 @@ class SubscriptionSerializer(CustomUserSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
+        limit = get_recipes_limit(self.context.get('request'))
         recipes = obj.recipes.all()
 
-        if limit:
-            try:
-                recipes = recipes[:int(limit)]
-            except (ValueError, TypeError):
-                pass
+        if limit is not None:
+            recipes = recipes[:limit]
 
         serializer = RecipeShortSerializer(
             recipes,
@@ -76,9 +174,6 @@ class SubscriptionSerializer(CustomUserSerializer):
         )
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для вывода ингредиентов с количеством."""
@@ -92,6 +187,33 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class BulkPrimaryKeyRelatedField(serializers.ManyRelatedField):
+    """Список объектов по id, которые проверяются одним запросом.
+
+    ManyRelatedField ищет каждый id отдельным запросом.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            try:
+                if isinstance(pk, bool):
+                    raise TypeError
+                pks.append(int(pk))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -114,10 +236,36 @@ class CustomUserCreateSerializer(DjoserUserCreateSerializer):
                   'first_name', 'last_name', 'password')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+def clean_ingredients(ingredients):
+    """Проверяет список ингредиентов рецепта без обращения к БД."""
+    if not ingredients:
+        raise serializers.ValidationError(
+            {'ingredients': 'Нужен хотя бы один ингредиент'})
+
+    cleaned = []
+    ingredient_ids = set()
+    for item in ingredients:
+        try:
+            ingredient_id = int(item.get('id'))
+            amount = int(item.get('amount'))
+        except (AttributeError, TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'ingredients': 'Некорректный список ингредиентов'})
+        if ingredient_id in ingredient_ids:
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиенты не должны повторяться'})
+        ingredient_ids.add(ingredient_id)
+        if amount < 1:
+            raise serializers.ValidationError(
+                {'amount': 'Количество должно быть больше 0'})
+        cleaned.append({'id': ingredient_id, 'amount': amount})
+    return cleaned
+
+
+class RecipeSerializer(MemberIdsMixin, serializers.ModelSerializer):
+    tags = BulkPrimaryKeyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()),
         required=False
     )
     author = CustomUserSerializer(read_only=True)
@@ -139,33 +287,27 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user, recipe=obj).exists()
-        return False
+        return obj.id in self.member_ids(FAVORITES)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return ShoppingCart.objects.filter(user=request.user, recipe=obj).exists()
-        return False
+        return obj.id in self.member_ids(SHOPPING_CART)
 
     def validate(self, data):
         ingredients = self.initial_data.get('ingredients')
-        if not ingredients:
-            raise serializers.ValidationError(
-                {'ingredients': 'Нужен хотя бы один ингредиент'})
-
-        ingredient_list = []
-        for item in ingredients:
-            ingredient_id = item.get('id')
-            if ingredient_id in ingredient_list:
-                raise serializers.ValidationError(
-                    {'ingredients': 'Ингредиенты не должны повторяться'})
-            ingredient_list.append(ingredient_id)
-            if int(item.get('amount')) < 1:
+        if isinstance(ingredients, str):
+            # в multipart/form-data ингредиенты передаются строкой JSON
+            try:
+                ingredients = json.loads(ingredients)
+            except ValueError:
                 raise serializers.ValidationError(
-                    {'amount': 'Количество должно быть больше 0'})
+                    {'ingredients': 'Некорректный список ингредиентов'})
+        ingredients = clean_ingredients(ingredients)
+
+        ingredient_ids = {ingredient['id'] for ingredient in ingredients}
+        found = Ingredient.objects.filter(id__in=ingredient_ids).count()
+        if found != len(ingredient_ids):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиент не найден'})
 
         data['ingredients'] = ingredients
         return data
@@ -181,6 +323,58 @@ class RecipeSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    def update_tags(self, tags, recipe):
+        """Удаляет и добавляет только изменившиеся теги рецепта."""
+        # теги рецепта загружены prefetch в get_queryset представления
+        current = {tag.id for tag in recipe.tags.all()}
+        new = {tag.id for tag in tags}
+        if current == new:
+            return
+        if current - new:
+            recipe.tags.remove(*(current - new))
+        if new - current:
+            recipe.tags.add(*(new - current))
+        getattr(recipe, '_prefetched_objects_cache', {}).pop('tags', None)
+
+    def update_ingredients(self, ingredients, recipe):
+        """Применяет к рецепту только разницу в ингредиентах."""
+        amounts = {
+            int(ingredient.get('id')): int(ingredient.get('amount'))
+            for ingredient in ingredients
+        }
+        to_delete = []
+        to_update = []
+        # разница по ингредиентам для списков покупок с этим рецептом
+        deltas = dict(amounts)
+        for recipe_ingredient in recipe.ingredient_list.all():
+            deltas[recipe_ingredient.ingredient_id] = (
+                deltas.get(recipe_ingredient.ingredient_id, 0)
+                - recipe_ingredient.amount)
+            amount = amounts.pop(recipe_ingredient.ingredient_id, None)
+            if amount is None:
+                to_delete.append(recipe_ingredient.id)
+            elif amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+
+        if to_delete or amounts:
+            # изменённые количества уже записаны в объекты кэша prefetch,
+            # а удалённые и новые строки он не отражает
+            getattr(recipe, '_prefetched_objects_cache', {}).pop(
+                'ingredient_list', None)
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if amounts:
+            self.create_ingredients(
+                [{'id': ingredient_id, 'amount': amount}
+                 for ingredient_id, amount in amounts.items()],
+                recipe
+            )
+        recipe_ingredients_changed(recipe.id, deltas)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags', [])
@@ -192,24 +386,149 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags', [])
 
-        instance.tags.clear()
-        if tags:
-            instance.tags.set(tags)
-
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
+        self.update_tags(tags, instance)
+        self.update_ingredients(ingredients, instance)
 
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        # после create/update кэш prefetch сброшен, загружаем связи
+        # заново тремя запросами; для списков это ничего не делает
+        prefetch_related_objects(
+            [instance], 'tags', 'ingredient_list__ingredient')
         representation = super().to_representation(instance)
         from .serializers import TagSerializer
         representation['tags'] = TagSerializer(
             instance.tags.all(), many=True).data
         return representation
+
+
+def _raw_ids(values):
+    """Все целочисленные id из списка id или словарей с ключом id."""
+    ids = set()
+    for value in values if isinstance(values, list) else ():
+        if isinstance(value, dict):
+            value = value.get('id')
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
+class RecipeImportListSerializer(serializers.ListSerializer):
+    """Пакетная загрузка рецептов.
+
+    Теги и ингредиенты всех рецептов проверяются одним запросом на каждую
+    таблицу, ошибки возвращаются списком по позициям пакета. Рецепты и
+    связи сохраняются несколькими bulk_create.
+    """
+    max_items = 500
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            if len(data) > self.max_items:
+                raise serializers.ValidationError(
+                    f'За один запрос можно загрузить не больше '
+                    f'{self.max_items} рецептов')
+            items = [item for item in data if isinstance(item, dict)]
+            self.existing_tags = set(Tag.objects.filter(
+                id__in=set().union(*(
+                    _raw_ids(item.get('tags')) for item in items))
+            ).values_list('id', flat=True))
+            self.existing_ingredients = set(Ingredient.objects.filter(
+                id__in=set().union(*(
+                    _raw_ids(item.get('ingredients')) for item in items))
+            ).values_list('id', flat=True))
+        return super().to_internal_value(data)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        recipes = [
+            Recipe(
+                author=item['author'],
+                name=item['name'],
+                image=item['image'],
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+            )
+            for item in validated_data
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            # bulk_create не вызывает сигналы, обновляем счётчики сами
+            for author, recipes_count in Counter(
+                    recipe.author_id for recipe in recipes).items():
+                User.objects.filter(pk=author).update(
+                    recipes_count=F('recipes_count') + recipes_count)
+            update_search_vectors([recipe.id for recipe in recipes])
+            for recipe in recipes:
+                fan_out(recipe)
+        else:
+            # без RETURNING (SQLite) первичные ключи получаем по одному
+            for recipe in recipes:
+                recipe.save()
+        # сигналы post_save при bulk_create не отправляются
+        bump_version(RECIPES)
+
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, item in zip(recipes, validated_data)
+            for tag_id in item['tags']
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for recipe, item in zip(recipes, validated_data)
+            for ingredient in item['ingredients']
+        ])
+        return recipes
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """Один рецепт в пакетной загрузке.
+
+    Используется только с many=True: существующие теги и ингредиенты уже
+    загружены RecipeImportListSerializer, поэтому проверки идут без БД.
+    """
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list)
+    ingredients = serializers.ListField(child=serializers.DictField())
+    image = Base64ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('tags', 'ingredients', 'name', 'image', 'text',
+                  'cooking_time')
+        list_serializer_class = RecipeImportListSerializer
+
+    def validate_tags(self, value):
+        missing = set(value) - self.parent.existing_tags
+        if missing:
+            raise serializers.ValidationError(
+                [f'Тег {tag_id} не найден' for tag_id in sorted(missing)])
+        return list(dict.fromkeys(value))
+
+    def validate_ingredients(self, value):
+        try:
+            ingredients = clean_ingredients(value)
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError(list(error.detail.values()))
+        missing = {
+            ingredient['id'] for ingredient in ingredients
+        } - self.parent.existing_ingredients
+        if missing:
+            raise serializers.ValidationError([
+                f'Ингредиент {ingredient_id} не найден'
+                for ingredient_id in sorted(missing)])
+        return ingredients
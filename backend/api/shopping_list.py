@@ -0,0 +1,52 @@
+import csv
+import json
+
+SHOPPING_LIST_HEADER = 'Список покупок:\n\n'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(items):
+    yield SHOPPING_LIST_HEADER
+    for item in items:
+        yield (
+            f"{item['ingredient__name']} "
+            f"({item['ingredient__measurement_unit']}) — {item['amount']}\n"
+        )
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['amount'],
+        ))
+
+
+def render_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+# формат -> (генератор строк, content type)
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
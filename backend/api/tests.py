@@ -1,3 +1,575 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import random
+import tracemalloc
 
-# Create your tests here.
+from api.management.commands.explain_recipe_filters import (
+    EXPECTED_INDEXES, Command as ExplainCommand)
+from api.representations import recipe_representations
+from api.serializers import Base64ImageField, RecipeSerializer
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from foodgram.asgi_handler import StreamingASGIHandler
+from foodgram.db_router import primary, replica_reads
+from PIL import Image
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.testing import PNG, RecipeDataMixin
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (APIRequestFactory, APITestCase,
+                                 APITransactionTestCase)
+from users.models import Subscription, User
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+    # COUNT, id страницы, рецепты с авторами, теги, ингредиенты
+    ANONYMOUS_QUERIES = 5
+    # плюс множества избранного, покупок и подписок пользователя
+    AUTHORIZED_QUERIES = 8
+
+    def setUp(self):
+        super().setUp()
+        for number in range(15):
+            self.create_recipe(self.user, name=f'Рецепт {number}')
+
+    def assert_list_queries(self, queries):
+        for limit in (2, 12):
+            # холодный кэш: ответы и множества пользователя не закэшированы
+            cache.clear()
+            with self.assertNumQueries(queries):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(self.ANONYMOUS_QUERIES)
+
+    def test_authorized(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(self.AUTHORIZED_QUERIES)
+
+
+class DownloadShoppingCartTest(RecipeDataMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        ShoppingCart.objects.create(
+            user=self.user, recipe=self.create_recipe(self.user))
+        self.client.force_authenticate(self.user)
+
+    def download(self, query=''):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_default_and_empty_format_is_txt(self):
+        for query in ('', '?format='):
+            response = self.download(query)
+            self.assertEqual(response['Content-Type'], 'text/plain')
+            self.assertIn('Ингредиент 0', b''.join(
+                response.streaming_content).decode())
+
+    def test_csv(self):
+        response = self.download('?format=csv')
+        self.assertIn('.csv', response['Content-Disposition'])
+
+
+@override_settings(ROOT_URLCONF='foodgram.urls_async')
+class AsyncDownloadShoppingCartTest(RecipeDataMixin, APITransactionTestCase):
+    """Список покупок под ASGI: форматы, права и потоковая отдача."""
+
+    def setUp(self):
+        super().setUp()
+        ShoppingCart.objects.create(
+            user=self.user, recipe=self.create_recipe(self.user))
+        self.token = Token.objects.create(user=self.user)
+
+    def download(self, query='', token=None, on_body=None):
+        """Запрос через StreamingASGIHandler: статус, заголовки, тело.
+
+        on_body получает части тела вместо того, чтобы копить их.
+        """
+        headers = [(b'host', b'testserver')]
+        if token is not None:
+            headers.append(
+                (b'authorization', f'Token {token.key}'.encode()))
+        start, body = {}, []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                start.update(message)
+            else:
+                (on_body or body.append)(message.get('body', b''))
+
+        async_to_sync(StreamingASGIHandler())({
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/recipes/download_shopping_cart/',
+            'query_string': query.encode(),
+            'headers': headers,
+        }, receive, send)
+        return start['status'], dict(start['headers']), b''.join(body)
+
+    def test_formats(self):
+        for query, content_type, start in (
+                ('', b'text/plain', 'Список покупок'),
+                ('format=txt', b'text/plain', 'Список покупок'),
+                ('format=csv', b'text/csv; charset=utf-8', 'name,'),
+                ('format=json', b'application/json', '[{"name"')):
+            status, headers, body = self.download(query, self.token)
+            self.assertEqual(status, 200, query)
+            self.assertEqual(headers[b'Content-Type'], content_type)
+            self.assertTrue(body.decode().startswith(start), body)
+            self.assertIn('Ингредиент 0', body.decode())
+
+    def test_anonymous(self):
+        status, _, _ = self.download('format=txt')
+        self.assertEqual(status, 401)
+
+    def test_streamed_in_chunks(self):
+        """Большой список не собирается в памяти целиком."""
+        # первый запрос импортирует модули и заполняет кэши Django
+        self.download('format=txt', self.token)
+        # длинные названия: тело намного больше постоянных расходов памяти
+        name = 'Продукт с длинным названием ' * 3
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'{name}{number:05}', measurement_unit='г')
+            for number in range(20000))
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user=self.user, ingredient_id=pk, amount=100)
+            for pk in Ingredient.objects.filter(
+                name__startswith=name).values_list('id', flat=True))
+        size = lines = 0
+
+        def count(chunk):
+            nonlocal size, lines
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+
+        tracemalloc.start()
+        try:
+            status, _, _ = self.download('format=txt', self.token, count)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(status, 200)
+        # заголовок и три ингредиента рецепта из корзины
+        self.assertEqual(lines, 2 + 3 + 20000)
+        self.assertLess(peak, size * 2 // 3)
+
+
+class SubscriptionRecipesLimitTest(RecipeDataMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for number in range(3):
+            self.create_recipe(self.author, name=f'Рецепт {number}')
+        self.client.force_authenticate(self.user)
+
+    def recipes(self, limit):
+        response = self.client.get(
+            f'/api/users/subscriptions/?recipes_limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'][0]['recipes']
+
+    def test_limits(self):
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/?recipes_limit=-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['recipes'], [])
+        self.assertEqual(len(self.recipes(2)), 2)
+        self.assertEqual(len(self.recipes('')), 3)
+        self.assertEqual(len(self.recipes('abc')), 3)
+        self.assertEqual(self.recipes(-1), [])
+        self.assertEqual(self.recipes(0), [])
+
+    def test_same_pub_date(self):
+        """Рецепты после массового импорта: те же, что в списке."""
+        Recipe.objects.update(pub_date=Recipe.objects.first().pub_date)
+        Subscription.objects.create(user=self.user, author=self.author)
+        response = self.client.get(
+            f'/api/recipes/?author={self.author.id}&limit=2')
+        self.assertEqual(
+            [recipe['id'] for recipe in self.recipes(2)],
+            [recipe['id'] for recipe in response.data['results']])
+
+
+def png_bytes(size):
+    """PNG из случайных пикселей: почти не сжимается."""
+    image = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class Base64ImageFieldTest(RecipeDataMixin, APITestCase):
+
+    def test_mime_line_breaks(self):
+        """base64 с переносом строк каждые 76 символов."""
+        content = png_bytes(300)
+        self.assertGreater(len(content), 200 * 1024)
+        self.client.force_authenticate(self.user)
+        response = self.client.put('/api/users/me/avatar/', {
+            'avatar': 'data:image/png;base64,'
+                      + base64.encodebytes(content).decode()
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.user.refresh_from_db()
+        with self.user.avatar.open('rb') as avatar:
+            self.assertEqual(avatar.read(), content)
+
+    def test_invalid_base64(self):
+        # неполная последняя четвёрка, в том числе после границы части
+        for imgstr in ('abc', 'a' * (64 * 1024 + 1), 'aaaa\n' * 20000 + 'a'):
+            with self.assertRaises(ValidationError):
+                Base64ImageField().decode_to_file(imgstr, 'temp.png')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1000)
+    def test_max_size(self):
+        imgstr = base64.encodebytes(os.urandom(1001)).decode()
+        with self.assertRaisesMessage(ValidationError, '1000'):
+            Base64ImageField().decode_to_file(imgstr, 'temp.png')
+        file = Base64ImageField().decode_to_file(
+            base64.encodebytes(os.urandom(1000)).decode(), 'temp.png')
+        self.assertEqual(len(file.read()), 1000)
+
+    def test_peak_memory(self):
+        """Декодирование 4 МБ держит в памяти только текущую часть."""
+        content = os.urandom(4 * 1024 * 1024)
+        imgstr = base64.encodebytes(content).decode()
+        tracemalloc.start()
+        try:
+            file = Base64ImageField().decode_to_file(imgstr, 'temp.png')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1024 * 1024)
+        self.assertEqual(file.read(), content)
+
+
+class RecipeUpdateQueriesTest(RecipeDataMixin, APITestCase):
+    """PATCH рецепта меняет только разницу и не перечитывает связи."""
+    # рецепт, теги, строки ингредиентов и ингредиенты (get_object),
+    # проверка тегов и ингредиентов, SAVEPOINT, UPDATE, RELEASE
+    UNCHANGED_QUERIES = 9
+    # плюс DELETE и SELECT + INSERT тегов, DELETE, UPDATE и INSERT
+    # ингредиентов, корзины с рецептом и повторный prefetch связей
+    CHANGED_QUERIES = 19
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe(self.user)
+        self.client.force_authenticate(self.user)
+        # множества избранного, покупок и подписок уже в кэше
+        self.client.get('/api/recipes/')
+
+    def patch(self, tags, amounts, queries):
+        body = {
+            'name': 'Новое название',
+            'text': 'Текст',
+            'cooking_time': 5,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': self.ingredients[number].id, 'amount': amount}
+                for number, amount in amounts.items()
+            ],
+        }
+        with self.assertNumQueries(queries):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/', body, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            response.json(),
+            self.client.get(f'/api/recipes/{self.recipe.id}/').json())
+        return response.json()
+
+    def test_unchanged_relations(self):
+        data = self.patch(self.tags[:2], {0: 10, 1: 10, 2: 10},
+                          self.UNCHANGED_QUERIES)
+        self.assertEqual(data['name'], 'Новое название')
+
+    def test_changed_relations(self):
+        data = self.patch(self.tags[1:], {0: 5, 1: 10, 3: 7},
+                          self.CHANGED_QUERIES)
+        self.assertEqual([tag['id'] for tag in data['tags']],
+                         [tag.id for tag in self.tags[1:]])
+        self.assertEqual(
+            [(item['id'], item['amount']) for item in data['ingredients']],
+            [(self.ingredients[0].id, 5), (self.ingredients[1].id, 10),
+             (self.ingredients[3].id, 7)])
+
+    def test_unknown_tag(self):
+        response = self.client.patch(f'/api/recipes/{self.recipe.id}/', {
+            'tags': [self.tags[0].id, 999], 'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.data)
+
+
+class RecipeTagFilterTest(RecipeDataMixin, APITestCase):
+    """Фильтр по нескольким тегам не дублирует рецепты."""
+
+    def setUp(self):
+        super().setUp()
+        self.both = self.create_recipe(self.user, tags=self.tags[:2])
+        self.first = self.create_recipe(self.user, tags=self.tags[:1])
+        self.create_recipe(self.user, tags=self.tags[2:])
+        self.query = f'tags={self.tags[0].slug}&tags={self.tags[1].slug}'
+
+    def test_no_duplicates(self):
+        response = self.client.get(f'/api/recipes/?{self.query}')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.first.id, self.both.id])
+
+    def test_no_duplicates_with_cursor(self):
+        response = self.client.get(f'/api/recipes/?{self.query}&cursor=')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.first.id, self.both.id])
+
+    def explain(self, query):
+        if connection.vendor == 'postgresql':
+            # на почти пустых таблицах Postgres выбирает полный просмотр,
+            # проверяем, что индекс вообще применим
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest(f'EXPLAIN для {connection.vendor} не проверяется')
+        return ExplainCommand.filter(query).explain()
+
+    def test_plans_use_indexes(self):
+        for name, query in (('tags', self.query),
+                            ('author', f'author={self.user.id}')):
+            plan = self.explain(query)
+            self.assertTrue(
+                any(index in plan for index in EXPECTED_INDEXES[name]),
+                plan)
+
+
+class RecipeMembershipFilterTest(RecipeDataMixin, APITestCase):
+    """Фильтры избранного и корзины не зависят от размера списков."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe(self.user, name=f'Рецепт {i}')
+                        for i in range(40)]
+        self.client.force_authenticate(self.user)
+
+    def list_queries(self, model, parameter, recipes):
+        model.objects.filter(user=self.user).delete()
+        model.objects.bulk_create(
+            model(user=self.user, recipe=recipe) for recipe in recipes)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/recipes/?{parameter}=1')
+        self.assertTrue(all(
+            recipe[parameter] for recipe in response.data['results']))
+        self.assertEqual(response.data['count'], len(recipes))
+        # запросы страницы и COUNT без списка id пользователя
+        return [query['sql'] for query in queries[:2]]
+
+    def test_sql_does_not_grow(self):
+        for model, parameter in ((Favorite, 'is_favorited'),
+                                 (ShoppingCart, 'is_in_shopping_cart')):
+            self.assertEqual(
+                self.list_queries(model, parameter, self.recipes[:6]),
+                self.list_queries(model, parameter, self.recipes))
+
+
+class CachedTokenUserTest(RecipeDataMixin, APITestCase):
+    """Пользователь из кэша токенов не затирает счётчики при сохранении."""
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        # пользователь с нулевыми счётчиками попадает в кэш токенов
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def test_saves_keep_counters(self):
+        follower = self.create_user('follower')
+        Subscription.objects.create(user=follower, author=self.user)
+        recipe = self.create_recipe(self.user)
+        Favorite.objects.create(user=follower, recipe=recipe)
+
+        response = self.client.put(
+            '/api/users/me/avatar/', {'avatar': PNG}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': 'Новое название', 'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.user.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (self.user.followers_count, self.user.recipes_count), (1, 1))
+        self.assertEqual(recipe.favorites_count, 1)
+
+
+class RecipeRepresentationsTest(RecipeDataMixin, APITestCase):
+    """recipe_representations выдаёт тот же JSON, что RecipeSerializer."""
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(7)
+        self.rng = rng
+        Tag.objects.filter(pk=self.tags[0].pk).update(color=None)
+        self.users = [self.user] + [
+            self.create_user(f'user{number}') for number in range(4)]
+        User.objects.filter(
+            pk__in=[user.pk for user in self.users[:2]]).update(
+            avatar='users/аватар 1.png')
+        self.recipe_ids = []
+        for number in range(30):
+            recipe = self.create_recipe(
+                rng.choice(self.users), name=f'Рецепт {number}',
+                tags=rng.sample(self.tags, rng.randint(0, 3)),
+                amounts=dict.fromkeys(
+                    range(rng.randint(1, len(self.ingredients))), 10))
+            self.recipe_ids.append(recipe.id)
+        for user in self.users:
+            for recipe_id in rng.sample(self.recipe_ids, 8):
+                Favorite.objects.create(user=user, recipe_id=recipe_id)
+            for recipe_id in rng.sample(self.recipe_ids, 5):
+                ShoppingCart.objects.create(user=user, recipe_id=recipe_id)
+            for author in rng.sample(self.users, 2):
+                if author != user:
+                    Subscription.objects.create(user=user, author=author)
+
+    @staticmethod
+    def render(data):
+        return JSONRenderer().render(data).decode()
+
+    def serializer_data(self, recipe_ids, request):
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'ingredient_list__ingredient').in_bulk(recipe_ids)
+        return RecipeSerializer(
+            [recipes[pk] for pk in recipe_ids], many=True,
+            context={'request': request}).data
+
+    def test_random_pages(self):
+        factory = APIRequestFactory()
+        for _ in range(30):
+            request = Request(factory.get('/api/recipes/'))
+            user = self.rng.choice([None] + self.users)
+            if user is not None:
+                request.user = user
+            page = self.rng.sample(
+                self.recipe_ids, self.rng.randint(1, len(self.recipe_ids)))
+            self.assertEqual(
+                self.render(recipe_representations(page, request)),
+                self.render(self.serializer_data(page, request)))
+
+    def test_api_responses(self):
+        for user in [None] + self.users:
+            self.client.force_authenticate(user)
+            for url in ('/api/recipes/?limit=100',
+                        '/api/recipes/?limit=7&page=2',
+                        '/api/recipes/?cursor=&limit=5',
+                        '/api/recipes/?is_favorited=1',
+                        f'/api/recipes/?tags={self.tags[1].slug}',
+                        '/api/recipes/feed/?limit=4'):
+                response = self.client.get(url)
+                if user is None and 'feed' in url:
+                    self.assertEqual(response.status_code, 401)
+                    continue
+                results = response.data['results']
+                self.assertEqual(self.render(results), self.render(
+                    self.serializer_data(
+                        [recipe['id'] for recipe in results],
+                        response.wsgi_request)))
+            response = self.client.get(f'/api/recipes/{self.recipe_ids[3]}/')
+            self.assertEqual(self.render(response.data), self.render(
+                self.serializer_data(
+                    [self.recipe_ids[3]], response.wsgi_request)[0]))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(RecipeDataMixin, APITransactionTestCase):
+    """Чтение уходит на реплику, запись и чтение после неё - в default.
+
+    replica в тестах - второе соединение с той же БД, поэтому проверяется
+    только, через какое соединение прошёл каждый запрос.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe(self.author)
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def queries(action):
+        """Число запросов к default и к replica во время action()."""
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            action()
+        return len(default), len(replica)
+
+    def get(self, url):
+        return self.queries(lambda: self.assertEqual(
+            self.client.get(url).status_code, 200))
+
+    def test_router(self):
+        def read():
+            return list(Tag.objects.all())
+
+        self.assertEqual(self.queries(read), (1, 0))
+        with replica_reads():
+            self.assertEqual(self.queries(read), (0, 1))
+            with primary():
+                self.assertEqual(self.queries(read), (1, 0))
+            self.assertEqual(self.queries(read), (0, 1))
+            self.assertEqual(self.queries(
+                lambda: Tag.objects.update(color=None)), (1, 0))
+
+    def test_reads(self):
+        # страница рецептов - с реплики, а множества избранного, корзины
+        # и подписок попадают в кэш, поэтому читаются с default
+        self.assertEqual(self.get('/api/recipes/'), (3, 5))
+        # дальше множества берутся из кэша
+        self.assertEqual(self.get(f'/api/recipes/{self.recipe.id}/'), (0, 4))
+        self.assertEqual(self.get(f'/api/users/{self.author.id}/'), (0, 1))
+        self.assertEqual(self.get('/api/users/subscriptions/'), (0, 1))
+        # ответ справочника кладётся в кэш, поэтому читается с default
+        self.assertEqual(self.get('/api/tags/'), (1, 0))
+
+    def test_sticky_after_write(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.get('/api/recipes/')
+        # неудачная запись не переключает пользователя на default
+        self.assertEqual(
+            self.client.post('/api/recipes/0/favorite/').status_code, 404)
+        self.assertEqual(self.get('/api/recipes/'), (0, 5))
+
+        self.assertEqual(self.queries(lambda: self.assertEqual(
+            self.client.post(url).status_code, 201))[1], 0)
+        # автор записи читает с default и видит её
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(len(replica), 0)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        # остальные пользователи - по-прежнему с реплики
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.get('/api/recipes/')[1], 5)
+
+        # окно REPLICA_STICKY_SECONDS закончилось
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.get('/api/recipes/'), (3, 5))
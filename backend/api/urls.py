@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from .views import (
-    IngredientViewSet, TagViewSet, RecipeViewSet, CustomUserViewSet
+    IngredientViewSet, TagViewSet, RecipeViewSet, CustomUserViewSet,
+    MetricsView
 )
 
 router = DefaultRouter()
@@ -14,6 +15,7 @@ urlpatterns = [
     path('users/me/avatar/',
          CustomUserViewSet.as_view({'put': 'avatar', 'delete': 'avatar'})),
 
+    path('metrics', MetricsView.as_view()),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
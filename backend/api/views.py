@@ -1,56 +1,123 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, SAFE_METHODS, AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, SAFE_METHODS, AllowAny
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from djoser.views import UserViewSet
-from .serializers import SubscriptionSerializer
+from .serializers import SubscriptionSerializer, get_recipes_limit
 from users.models import Subscription
 from django.contrib.auth import get_user_model
-from recipes.models import Ingredient, Recipe, Tag, Favorite, ShoppingCart, RecipeIngredient
+from recipes.ingredient_index import ingredient_index
+from recipes.shopping_cart import set_portions, shopping_list
+from recipes.short_links import get_short_code
+from recipes.models import Ingredient, Recipe, Tag, Favorite, ShoppingCart
+from recipes.versions import INGREDIENTS, TAGS
+from .cache import AnonymousRecipeCacheMixin, ReferenceCacheMixin
+from .replicas import ReplicaReadMixin
+from .representations import (RecipeRepresentationMixin,
+                              recipe_representations)
 from .filters import IngredientFilter, RecipeFilter
+from .metrics import registry
 from .permissions import IsAuthorOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
+from .shopping_list import SHOPPING_LIST_FORMATS
 from .serializers import (
-    IngredientSerializer, RecipeSerializer, TagSerializer, RecipeIngredientSerializer, UserAvatarSerializer
+    IngredientSerializer, RecipeSerializer, TagSerializer, RecipeIngredientSerializer, UserAvatarSerializer,
+    RecipeImportSerializer, RecipeShortSerializer, ShoppingCartSerializer
 )
 from rest_framework.pagination import PageNumberPagination
+from .pagination import (FeedPagination, LimitPageNumberPagination,
+                         RecipePagination)
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, ReferenceCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
+    reference_name = TAGS
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, ReferenceCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    reference_name = INGREDIENTS
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(self._search, request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def _search(self, request, *args, **kwargs):
+        # автодополнение отвечает из индекса в памяти, без запроса к БД
+        return Response(
+            ingredient_index.search(request.query_params.get('name', '')))
+
+
+class RecipeViewSet(ReplicaReadMixin, AnonymousRecipeCacheMixin,
+                    RecipeRepresentationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrReadOnly, )
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    # действия чтения, которые отдаёт api.representations без сериализатора
+    representation_actions = ('list', 'retrieve', 'feed')
+
+    def get_queryset(self):
+        if self.action in self.representation_actions:
+            # страница выбирает только ключ и поля курсора,
+            # данные рецептов загружает recipe_representations
+            return Recipe.objects.only('id', 'pub_date')
+        # все связанные данные достаём заранее, чтобы число запросов
+        # не зависело от размера страницы
+        # флаги is_favorited/is_in_shopping_cart сериализатор берёт
+        # из кэша множеств пользователя (recipes.membership)
+        return Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'ingredient_list__ingredient')
+
+    def update(self, request, *args, **kwargs):
+        # в отличие от UpdateModelMixin кэш prefetch не сбрасывается:
+        # RecipeSerializer.update сам убирает из него изменённые связи,
+        # и ответ не загружает теги и ингредиенты заново
+        serializer = self.get_serializer(
+            self.get_object(), data=request.data,
+            partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
 
     def perform_create(self, serializer):
         # при создании рецепта автором автоматически ставится текущий пользователь
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(recipe_representations(
+            [recipe.id for recipe in page], request))
+
     # метод для добавления/удаления рецепта из избранного или корзины
-    def _add_to_list(self, model, user, pk):
+    def _add_to_list(self, model, user, pk, **fields):
         recipe = get_object_or_404(Recipe, id=pk)
         if model.objects.filter(user=user, recipe=recipe).exists():
             return Response({'errors': 'Рецепт уже добавлен'}, status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(user=user, recipe=recipe)
+        model.objects.create(user=user, recipe=recipe, **fields)
         serializer = RecipeSerializer(
             recipe, context={'request': self.request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -69,29 +136,55 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self._add_to_list(Favorite, request.user, pk)
         return self._delete_from_list(Favorite, request.user, pk)
 
-    @action(detail=True, methods=['post', 'delete'], permission_classes=[IsAuthenticated])
+    @action(detail=True, methods=['post', 'patch', 'delete'], permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
+        if request.method == 'DELETE':
+            return self._delete_from_list(ShoppingCart, request.user, pk)
+        # число порций: ингредиенты рецепта умножаются на него; при
+        # добавлении необязательно, при изменении (PATCH) обязательно
+        serializer = ShoppingCartSerializer(
+            data=request.data, partial=request.method == 'POST')
+        serializer.is_valid(raise_exception=True)
         if request.method == 'POST':
-            return self._add_to_list(ShoppingCart, request.user, pk)
-        return self._delete_from_list(ShoppingCart, request.user, pk)
+            return self._add_to_list(
+                ShoppingCart, request.user, pk, **serializer.validated_data)
+        cart_item = get_object_or_404(
+            ShoppingCart, user=request.user, recipe_id=pk)
+        set_portions(cart_item, serializer.validated_data['portions'])
+        return Response(ShoppingCartSerializer(cart_item).data)
 
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        """Пакетная загрузка рецептов текущего пользователя."""
+        serializer = RecipeImportSerializer(
+            data=request.data, many=True, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.save(author=request.user)
+        return Response(
+            RecipeShortSerializer(
+                recipes, many=True, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer]
+    )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        shopping_list = "Список покупок:\n\n"
-        for item in ingredients:
-            shopping_list += (
-                f"{item['ingredient__name']} "
-                f"({item['ingredient__measurement_unit']}) — {item['amount']}\n"
-            )
+        # формат выбирается параметром ?format=, по умолчанию
+        # (и при пустом значении) txt
+        shopping_format = request.query_params.get('format') or 'txt'
+        render, content_type = SHOPPING_LIST_FORMATS[shopping_format]
 
-        filename = "foodgram_shopping_list.txt"
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        # суммы поддерживаются при изменении корзины (recipes.shopping_cart),
+        # строки читаются и отдаются клиенту по мере получения
+        ingredients = shopping_list(request.user)
+
+        filename = f'foodgram_shopping_list.{shopping_format}'
+        response = StreamingHttpResponse(
+            render(ingredients), content_type=content_type)
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
@@ -103,26 +196,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def get_link(self, request, pk=None):
         recipe = get_object_or_404(Recipe, id=pk)
-        link = request.build_absolute_uri(f'/recipes/{pk}/')
+        link = request.build_absolute_uri(
+            reverse('short-link', args=[get_short_code(recipe)]))
         return Response({'short-link': link})
 
 
-class LimitPageNumberPagination(PageNumberPagination):
-    page_size = 6
-    page_size_query_param = 'limit'
-
-
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(ReplicaReadMixin, UserViewSet):
     """
     Кастомный вьюсет для пользователей.
     Наследуется от Djoser, добавляет управление подписками.
     """
     pagination_class = LimitPageNumberPagination
 
+    @staticmethod
+    def _limited_recipes(request):
+        """Первые recipes_limit рецептов каждого автора одним запросом."""
+        recipes = Recipe.objects.all()
+        limit = get_recipes_limit(request)
+        if limit is None:
+            return recipes
+        # Django 3.2 не умеет фильтровать по оконным функциям,
+        # поэтому ограничиваем выборку коррелированным подзапросом с LIMIT;
+        # порядок как у Recipe.Meta.ordering, иначе при равных pub_date
+        # выбор не совпадёт со списком рецептов
+        latest = Recipe.objects.filter(
+            author_id=OuterRef('author_id')
+        ).order_by('-pub_date', '-id').values('id')[:limit]
+        return recipes.filter(id__in=Subquery(latest))
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(subscribing__user=user)
+        queryset = User.objects.filter(subscribing__user=user).prefetch_related(
+            Prefetch('recipes', queryset=self._limited_recipes(request))
+        )
 
         paginator = PageNumberPagination()
         paginator.page_size = 6
@@ -189,6 +296,19 @@ class CustomUserViewSet(UserViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         # Если DELETE - удаляем аватарку
+        # файл освобождает сигнал: он может быть общим с другими записями
         if user.avatar:
-            user.avatar.delete()
+            user.avatar = None
+            user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MetricsView(APIView):
+    """Метрики запросов в формате Prometheus, только для администраторов."""
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request):
+        return HttpResponse(
+            registry.export(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+
+from foodgram.asgi_handler import StreamingASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_API', 'True')
 
-application = get_asgi_application()
+# как get_asgi_application(), но с отдачей потоковых ответов вне цикла
+# событий, см. foodgram.asgi_handler
+django.setup(set_prefix=False)
+application = StreamingASGIHandler()
@@ -0,0 +1,71 @@
+"""ASGI-обработчик, который отдаёт потоковые ответы вне цикла событий.
+
+Django 3.2 перебирает тело StreamingHttpResponse прямо в цикле событий,
+а список покупок читает БД по ходу отдачи, что там запрещено. Дочитывать
+ответ в память заранее тоже нельзя: он может быть большим. Здесь тело
+перебирается в отдельном потоке порциями по chunk_size, а цикл событий
+отправляет каждую порцию клиенту, пока поток читает следующую.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StreamingASGIHandler(ASGIHandler):
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        # один поток на ответ: генератор и его соединение с БД не переходят
+        # между потоками, а закрытие ответа (сигнал request_finished)
+        # закрывает соединение этого же потока
+        executor = ThreadPoolExecutor(max_workers=1)
+        in_thread = partial(
+            sync_to_async, thread_sensitive=False, executor=executor)
+        parts = iter(response)
+        try:
+            while True:
+                chunk = await in_thread(self.read_chunk)(parts)
+                if not chunk:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body'})
+        finally:
+            await in_thread(response.close)()
+            executor.shutdown(wait=False)
+
+    def read_chunk(self, parts):
+        """Следующая порция тела, пустая - когда тело закончилось."""
+        chunk = bytearray()
+        for part in parts:
+            chunk += part
+            if len(chunk) >= self.chunk_size:
+                break
+        return bytes(chunk)
+
+    @staticmethod
+    def response_headers(response):
+        # как в ASGIHandler.send_response: регистр заголовков сохраняется
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((
+                b'Set-Cookie',
+                cookie.output(header='').encode('ascii').strip()))
+        return headers
@@ -0,0 +1,50 @@
+"""Маршрутизация чтения на реплики БД.
+
+Реплики перечисляются в DB_REPLICAS (см. settings), без них роутер ничего
+не меняет. Чтение уходит на реплику только внутри replica_reads(): его
+включает api.replicas.ReplicaReadMixin для GET-запросов выбранных
+вьюсетов. Запись и всё остальное чтение идут в default.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def primary():
+    """Чтение в блоке идёт с основной БД, даже если включены реплики.
+
+    Нужно там, где прочитанное кладётся в кэш под новую версию данных:
+    отставшая реплика закрепила бы в нём старое состояние.
+    """
+    return replica_reads(False)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class LRUCache:
+    """Ограниченный по размеру словарь в памяти воркера.
+
+    С timeout записи старше заданного числа секунд считаются
+    отсутствующими.
+    """
+
+    def __init__(self, maxsize, timeout=None):
+        self._lock = Lock()
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.timeout = timeout
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            value, expires = self._data[key]
+            if expires is not None and expires <= monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = None if self.timeout is None else monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,26 @@
+class QueryUpdatedFieldsMixin:
+    """Поля модели, которые меняются только запросами UPDATE.
+
+    Счётчики обновляются через F(), код короткой ссылки и поисковый
+    вектор - отдельными запросами. save() существующей записи эти поля
+    не пишет: экземпляр мог быть загружен раньше и вернул бы в БД
+    устаревшие значения.
+    """
+    query_updated_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and self.pk is not None
+                and not kwargs.get('force_insert')):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                # как save() без update_fields: все загруженные поля
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [
+                name for name in update_fields
+                if name not in self.query_updated_fields
+            ]
+        super().save(*args, **kwargs)
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'users',
     'recipes',
@@ -57,9 +58,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сбор метрик запросов для /api/metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'api.metrics.MetricsMiddleware')
+
 CSRF_TRUSTED_ORIGINS = ['http://localhost:8000', 'http://127.0.0.1:8000']
 
-ROOT_URLCONF = 'foodgram.urls'
+# Под ASGI горячие эндпоинты чтения обслуживаются асинхронно
+ASYNC_API = os.getenv('ASYNC_API', 'False') == 'True'
+ROOT_URLCONF = 'foodgram.urls_async' if ASYNC_API else 'foodgram.urls'
 
 TEMPLATES = [
     {
@@ -92,9 +100,72 @@ DATABASES = {
 
         'HOST': os.getenv('DB_HOST', 'db'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # постоянные соединения: секунды жизни, 0 - новое на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # PgBouncer в режиме transaction не поддерживает серверные курсоры,
+        # которые использует QuerySet.iterator()
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', 'False') == 'True',
     }
 }
 
+# Реплики для чтения: DB_REPLICAS=host1:5432,host2 (см. foodgram.db_router)
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Реплика-зеркало для тестов роутера (api/tests.py): в тестах это второе
+# соединение с той же БД. В DATABASE_REPLICAS не входит, тесты включают
+# её сами.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает с основной БД
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache
+# Локально и в тестах - LocMem, в продакшене задаётся общий бэкенд,
+# например django.core.cache.backends.memcached.PyMemcacheCache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Время жизни множеств избранного, покупок и подписок пользователя, сек
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 300))
+
+# Лента подписок: рецепты авторов, у которых подписчиков больше порога,
+# не раскладываются по лентам, а дочитываются при запросе ленты
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+# Сколько последних рецептов автора попадает в ленту при подписке
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+# Кэш токенов авторизации (api.authentication): время жизни в общем кэше
+# и в памяти воркера, сек; TOKEN_CACHE_LOCAL_TTL=0 отключает локальный кэш
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+TOKEN_CACHE_LOCAL_TTL = int(os.getenv('TOKEN_CACHE_LOCAL_TTL', 5))
+TOKEN_CACHE_LOCAL_SIZE = int(os.getenv('TOKEN_CACHE_LOCAL_SIZE', 10000))
+
+# Сколько кодов коротких ссылок держит в памяти каждый воркер
+SHORT_LINK_LRU_SIZE = int(os.getenv('SHORT_LINK_LRU_SIZE', 10000))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -144,7 +215,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -174,3 +245,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'django_static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Имена файлов по содержимому, одинаковые загрузки хранятся один раз
+DEFAULT_FILE_STORAGE = 'foodgram.storage.HashedMediaStorage'
+
+# Максимальный размер загружаемого изображения (рецепт, аватар), в байтах
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 5 * 1024 * 1024))
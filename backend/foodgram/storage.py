@@ -0,0 +1,94 @@
+"""Хранилище медиафайлов с именами по содержимому.
+
+Файл сохраняется как <upload_to>/<ab>/<sha256>.<ext>: одинаковые загрузки
+ложатся в один файл, а имя никогда не указывает на другое содержимое,
+поэтому nginx отдаёт такие файлы с Cache-Control: immutable.
+
+Сколько записей ссылается на файл, хранит recipes.MediaFile. Сохранение
+увеличивает счётчик, delete() уменьшает его, а сам файл удаляется после
+коммита, когда ссылок не осталось. Файлы, сохранённые до появления этого
+хранилища, счётчика не имеют и не удаляются.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+EXTENSION_RE = re.compile(r'\.[a-z0-9]{1,10}')
+
+
+def _media_files():
+    # модель импортируется лениво: хранилище создаётся до загрузки приложений
+    from recipes.models import MediaFile
+    return MediaFile.objects
+
+
+class HashedMediaStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # имя определяется содержимым в _save(), совпадение - не конфликт
+        return name
+
+    @staticmethod
+    def hashed_name(name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        if not EXTENSION_RE.fullmatch(extension):
+            extension = ''
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest + extension)
+
+    @transaction.atomic
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        # сначала счётчик: его строка заблокирована до коммита, и
+        # параллельное удаление последней ссылки не уберёт файл из-под нас
+        media_files = _media_files()
+        while not media_files.filter(name=name).update(refs=F('refs') + 1):
+            media_files.bulk_create(
+                [media_files.model(name=name, refs=0)], ignore_conflicts=True)
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # пишем во временный файл и переименовываем: читатель никогда
+        # не увидит файл наполовину
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def delete(self, name):
+        """Убирает одну ссылку на файл; файл удаляется вместе с последней."""
+        if not name:
+            return
+        media_files = _media_files()
+        media_files.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+        transaction.on_commit(lambda: self.collect(name))
+
+    @transaction.atomic
+    def collect(self, name):
+        """Удаляет файл, если на него не осталось ссылок."""
+        media_file = _media_files().select_for_update().filter(
+            name=name, refs=0).first()
+        if media_file is not None:
+            super().delete(name)
+            media_file.delete()
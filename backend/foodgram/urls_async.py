@@ -0,0 +1,12 @@
+"""URL-схема для ASGI: горячие эндпоинты чтения обслуживаются асинхронно.
+
+Используется, когда включена настройка ASYNC_API (см. foodgram/asgi.py),
+остальные адреса совпадают с foodgram.urls.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+] + sync_urlpatterns
@@ -1,8 +1,10 @@
 from django.contrib import admin
 from .models import (
     Favorite, Ingredient, Recipe,
-    RecipeIngredient, ShoppingCart, Tag
+    RecipeIngredient, RecipeTag, ShoppingCart, Tag
 )
+from .shopping_cart import (recipe_amounts, recipe_ingredients_changed,
+                            set_portions)
 
 
 @admin.register(Ingredient)
@@ -21,16 +23,33 @@ class RecipeIngredientInline(admin.TabularInline):
     min_num = 1
 
 
+class RecipeTagInline(admin.TabularInline):
+    model = RecipeTag
+    min_num = 1
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'get_favorites_count')
     list_filter = ('author', 'name', 'tags')
     search_fields = ('name', 'author__username')
-    inlines = (RecipeIngredientInline,)
+    inlines = (RecipeIngredientInline, RecipeTagInline)
 
     def get_favorites_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
     get_favorites_count.short_description = 'В избранном'
+    get_favorites_count.admin_order_field = 'favorites_count'
+
+    def save_related(self, request, form, formsets, change):
+        # правка ингредиентов меняет списки покупок с этим рецептом
+        before = recipe_amounts(form.instance.id) if change else {}
+        super().save_related(request, form, formsets, change)
+        after = recipe_amounts(form.instance.id)
+        recipe_ingredients_changed(form.instance.id, {
+            ingredient_id: after.get(ingredient_id, 0)
+            - before.get(ingredient_id, 0)
+            for ingredient_id in before.keys() | after.keys()
+        })
 
 
 @admin.register(Favorite)
@@ -40,4 +59,14 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe')
+    list_display = ('user', 'recipe', 'portions')
+
+    def get_readonly_fields(self, request, obj=None):
+        # суммы списка покупок пересчитываются только при смене порций
+        return ('user', 'recipe') if obj else ()
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            set_portions(obj, obj.portions)
+        else:
+            super().save_model(request, obj, form, change)
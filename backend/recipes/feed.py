@@ -0,0 +1,129 @@
+"""Лента подписок: новые рецепты авторов, на которых подписан пользователь.
+
+Рецепт автора с числом подписчиков не больше FEED_FANOUT_MAX_FOLLOWERS
+при публикации раскладывается по лентам подписчиков (таблица FeedEntry).
+Рецепты более популярных авторов не раскладываются: при чтении ленты они
+выбираются из Recipe по индексу (author, pub_date) и сливаются с записями
+ленты. Так и публикация, и чтение ленты обходятся ограниченным числом
+строк.
+"""
+from heapq import merge
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from users.models import Subscription
+
+from .models import FeedEntry, Recipe, User
+
+
+def is_push_author(author_id, lock=False):
+    users = User.objects.filter(pk=author_id)
+    if lock:
+        # строка автора заблокирована до коммита: параллельные подписки
+        # и отписки меняют счётчик по очереди
+        users = users.select_for_update()
+    followers_count = users.values_list('followers_count', flat=True).first()
+    return (followers_count is not None
+            and followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS)
+
+
+def _save(user_ids, recipes):
+    """Добавляет рецепты (id, pub_date) в ленты пользователей."""
+    entries = [
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+        for user_id in user_ids
+        for recipe_id, pub_date in recipes
+    ]
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=1000, ignore_conflicts=True)
+    return len(entries)
+
+
+def _latest_recipes(author_id):
+    return list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.FEED_BACKFILL_SIZE])
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    if not is_push_author(recipe.author_id):
+        return
+    _save(
+        Subscription.objects.filter(
+            author_id=recipe.author_id).values_list('user_id', flat=True),
+        [(recipe.id, recipe.pub_date)]
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту нового подписчика последними рецептами автора."""
+    if is_push_author(author_id):
+        _save([user_id], _latest_recipes(author_id))
+
+
+def remove(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def restore_push(author_id):
+    """Автор снова раскладывает рецепты по лентам подписчиков.
+
+    Рецепты, опубликованные без раскладки, раньше находило чтение ленты,
+    теперь их нужно разложить. Раскладка идёт после коммита: отписка
+    может быть частью каскадного удаления, в котором рецепты автора
+    ещё удаляются.
+    """
+    transaction.on_commit(lambda: rebuild_author(author_id))
+
+
+@transaction.atomic
+def rebuild_author(author_id):
+    """Заново раскладывает последние рецепты автора по лентам."""
+    FeedEntry.objects.filter(recipe__author_id=author_id).delete()
+    if not is_push_author(author_id):
+        return 0
+    return _save(
+        Subscription.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True),
+        _latest_recipes(author_id)
+    )
+
+
+def _before(position, id_field):
+    pub_date, pk = position
+    return Q(pub_date__lt=pub_date) | Q(pub_date=pub_date,
+                                        **{f'{id_field}__lt': pk})
+
+
+def feed_recipe_ids(user, position=None, size=6):
+    """id рецептов ленты, начиная после position=(pub_date, id).
+
+    Записи ленты и рецепты популярных авторов уже упорядочены
+    по (pub_date, id), поэтому из каждого источника достаточно
+    взять size строк и слить их.
+    """
+    pushed = FeedEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(author__in=Subscription.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values('author'))
+    if position is not None:
+        pushed = pushed.filter(_before(position, 'recipe_id'))
+        pulled = pulled.filter(_before(position, 'id'))
+    pushed = pushed.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id')[:size]
+    pulled = pulled.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id')[:size]
+
+    ids = []
+    # рецепт автора, ставшего популярным, может быть в обоих источниках
+    for _, recipe_id in merge(pushed, pulled, reverse=True):
+        if not ids or ids[-1] != recipe_id:
+            ids.append(recipe_id)
+        if len(ids) == size:
+            break
+    return ids
@@ -0,0 +1,59 @@
+from bisect import bisect_left
+from threading import Lock
+
+from foodgram.db_router import primary
+
+from .models import Ingredient
+from .versions import INGREDIENTS, get_version
+
+
+class IngredientIndex:
+    """Префиксный индекс по названиям ингредиентов в памяти воркера.
+
+    Строится лениво при первом поиске и перестраивается, когда меняется
+    версия ингредиентов в кэше (см. recipes.signals).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = []
+        self._items = []
+
+    def _build(self, version):
+        with primary():
+            rows = sorted(
+                Ingredient.objects.values('id', 'name', 'measurement_unit'),
+                key=lambda row: (
+                    row['name'].casefold(), row['name'], row['id'])
+            )
+        self._keys = [row['name'].casefold() for row in rows]
+        self._items = rows
+        self._version = version
+
+    def _ensure_built(self):
+        version = get_version(INGREDIENTS)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build(version)
+
+    def search(self, query=''):
+        """Сначала названия, начинающиеся с query, затем содержащие его."""
+        self._ensure_built()
+        keys, items = self._keys, self._items
+        query = query.casefold()
+        if not query:
+            return list(items)
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        contains = [
+            items[i] for i, key in enumerate(keys)
+            if query in key and not start <= i < end
+        ]
+        return items[start:end] + contains
+
+
+ingredient_index = IngredientIndex()
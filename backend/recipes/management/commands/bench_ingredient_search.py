@@ -0,0 +1,48 @@
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+from django.db.models import Case, IntegerField, Value, When
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+def orm_search(query):
+    """Тот же поиск через ORM: LIKE по префиксу и по вхождению."""
+    return list(
+        Ingredient.objects.filter(name__icontains=query).annotate(
+            prefix=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('prefix', 'name').values('id', 'name', 'measurement_unit')
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска ингредиентов: индекс в памяти против ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Сколько раз выполнить каждый запрос')
+
+    def handle(self, *args, **options):
+        names = list(
+            Ingredient.objects.values_list('name', flat=True)[:50])
+        if not names:
+            self.stdout.write(self.style.ERROR(
+                'Нет ингредиентов, сначала выполните load_ingredients'))
+            return
+        # префиксы разной длины, как при наборе текста в редакторе рецепта
+        queries = [name[:length] for name in names for length in (1, 2, 4)]
+        repeat = options['repeat']
+        ingredient_index.search()
+
+        for title, search in (('ORM', orm_search),
+                              ('Индекс', ingredient_index.search)):
+            seconds = timeit(
+                lambda: [search(query) for query in queries], number=repeat)
+            per_query = seconds / (repeat * len(queries)) * 1_000_000
+            self.stdout.write(f'{title}: {per_query:.1f} мкс на запрос')
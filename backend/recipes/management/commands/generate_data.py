@@ -0,0 +1,130 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.search import update_search_vectors
+from recipes.versions import RECIPES, bump_version
+from users.models import Subscription, User
+
+
+class Command(BaseCommand):
+    help = 'Заполнение БД синтетическими данными для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--subscriptions', type=int, default=20,
+            help='Подписок у каждого пользователя')
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Рецептов в избранном у каждого пользователя')
+        parser.add_argument(
+            '--cart', type=int, default=10,
+            help='Рецептов в списке покупок у каждого пользователя')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # префикс отделяет данные разных запусков генератора
+        prefix = f'gen{options["seed"]}_{User.objects.count()}'
+
+        if not Ingredient.objects.exists():
+            self.bulk(Ingredient, [
+                Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+                for i in range(500)
+            ])
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True))
+
+        self.bulk(Tag, [
+            Tag(name=f'{prefix} тег {i}', slug=f'{prefix}_tag_{i}',
+                color=None)
+            for i in range(options['tags'])
+        ])
+        tag_ids = list(Tag.objects.filter(
+            slug__startswith=f'{prefix}_tag_').values_list('id', flat=True))
+
+        password = make_password('password')
+        self.bulk(User, [
+            User(
+                email=f'{prefix}_{i}@example.com',
+                username=f'{prefix}_{i}',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            )
+            for i in range(options['users'])
+        ])
+        user_ids = list(User.objects.filter(
+            username__startswith=f'{prefix}_').values_list('id', flat=True))
+
+        self.bulk(Recipe, [
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f'{prefix} рецепт {i}',
+                image='recipes/images/generated.png',
+                text='Сгенерированный рецепт',
+                cooking_time=rng.randint(1, 180),
+            )
+            for i in range(options['recipes'])
+        ])
+        recipe_ids = list(Recipe.objects.filter(
+            author_id__in=user_ids).values_list('id', flat=True))
+
+        self.bulk(RecipeTag, [
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, min(2, len(tag_ids)))
+        ])
+        self.bulk(RecipeIngredient, [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids,
+                min(options['ingredients_per_recipe'], len(ingredient_ids)))
+        ])
+
+        self.bulk(Subscription, [
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(
+                user_ids, min(options['subscriptions'], len(user_ids)))
+            if author_id != user_id
+        ])
+        for model, option in ((Favorite, 'favorites'),
+                              (ShoppingCart, 'cart')):
+            self.bulk(model, [
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rng.sample(
+                    recipe_ids, min(options[option], len(recipe_ids)))
+            ])
+
+        # bulk_create не вызывает сигналы: пересчитываем счётчики,
+        # ленты подписок, списки покупок и сбрасываем кэш ленты рецептов
+        call_command('recount_counters', stdout=self.stdout)
+        call_command('rebuild_feeds', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        update_search_vectors()
+        bump_version(RECIPES)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {len(user_ids)} пользователей, '
+            f'{len(recipe_ids)} рецептов, {len(tag_ids)} тегов'))
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {len(objects)}')
@@ -1,35 +1,124 @@
+import csv
 import json
 import os
+from itertools import islice
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, bump_version
+
+DEFAULT_FILE = os.path.join(
+    settings.BASE_DIR, '..', 'data', 'ingredients.json')
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Построчно отдаёт объекты из JSON-массива, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise ValueError('Ожидается JSON-массив')
+                buffer = buffer[1:]
+                started = True
+                continue
+            buffer = buffer.lstrip(',').lstrip()
+            if not buffer or buffer[0] == ']':
+                break
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                # объект ещё не дочитан целиком
+                if not chunk:
+                    raise
+                break
+            buffer = buffer[end:]
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            return
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {
+    'json': read_json,
+    'csv': read_csv,
+}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из JSON (безопасный режим)'
+    help = 'Загрузка ингредиентов из JSON или CSV (безопасный режим)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=DEFAULT_FILE,
+            help='Путь к файлу с ингредиентами')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько ингредиентов вставлять за один запрос')
 
     def handle(self, *args, **options):
-        file_path = os.path.join(settings.BASE_DIR, '..', 'data', 'ingredients.json')
-        print(f"Загрузка из файла: {file_path}")
+        file_path = options['file']
+        file_format = options['format'] or (
+            os.path.splitext(file_path)[1].lstrip('.').lower())
+        batch_size = options['batch_size']
+        self.stdout.write(f'Загрузка из файла: {file_path}')
 
         if not os.path.exists(file_path):
-            self.stdout.write(self.style.ERROR('Файл JSON не найден! Проверьте путь.'))
+            self.stdout.write(self.style.ERROR(
+                'Файл не найден! Проверьте путь.'))
+            return
+        if file_format not in READERS:
+            self.stdout.write(self.style.ERROR(
+                f'Неизвестный формат файла: {file_format}'))
             return
 
         try:
+            before = Ingredient.objects.count()
             with open(file_path, encoding='utf-8') as f:
-                data = json.load(f)
-                
-                # Используем счетчик для красоты
-                count = 0
-                for item in data:
-                    # get_or_create защищает от дубликатов и не вызывает ошибку bulk_create
-                    Ingredient.objects.get_or_create(
-                        name=item['name'],
-                        measurement_unit=item['measurement_unit']
+                rows = self.unique_rows(READERS[file_format](f))
+                processed = 0
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    # уже существующие пары пропускаются unique_ingredient
+                    Ingredient.objects.bulk_create(
+                        [Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in batch],
+                        ignore_conflicts=True
                     )
-                    count += 1
+                    processed += len(batch)
+                    self.stdout.write(f'Обработано {processed} ингредиентов')
+            # bulk_create не вызывает сигналы, сбрасываем индекс сами
+            bump_version(INGREDIENTS)
+            created = Ingredient.objects.count() - before
+            self.stdout.write(self.style.SUCCESS(
+                f'Успешно загружено {created} новых ингредиентов'))
 
-            self.stdout.write(self.style.SUCCESS(f'Успешно загружено {count} ингредиентов'))
-            
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Ошибка: {e}'))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'Ошибка: {e}'))
+
+    @staticmethod
+    def unique_rows(rows):
+        seen = set()
+        for name, unit in rows:
+            key = (name.strip(), unit.strip())
+            if key not in seen:
+                seen.add(key)
+                yield key
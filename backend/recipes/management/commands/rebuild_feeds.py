@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.feed import rebuild_author
+from recipes.models import FeedEntry, User
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает ленты подписок: нужно после массовой загрузки '
+            'данных и после смены порога FEED_FANOUT_MAX_FOLLOWERS')
+
+    def handle(self, *args, **options):
+        # у популярных авторов записей в лентах быть не должно
+        FeedEntry.objects.filter(
+            recipe__author__followers_count__gt=(
+                settings.FEED_FANOUT_MAX_FOLLOWERS)
+        ).delete()
+        authors = list(User.objects.filter(
+            followers_count__gt=0,
+            followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+            recipes_count__gt=0,
+        ).values_list('id', flat=True))
+        entries = sum(rebuild_author(author_id) for author_id in authors)
+        self.stdout.write(self.style.SUCCESS(
+            f'Лента подписок: {entries} записей, авторов: {len(authors)}'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes.models import User
+from recipes.shopping_cart import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает с нуля суммы списков покупок '
+            '(recipes.shopping_cart) по корзинам пользователей')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя, можно указать несколько раз; '
+                 'по умолчанию все, у кого есть корзина или список')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or list(User.objects.filter(
+            Q(shopping_cart__isnull=False) | Q(shopping_list__isnull=False)
+        ).distinct().values_list('id', flat=True))
+        for user_id in user_ids:
+            rebuild(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны: {len(user_ids)}'))
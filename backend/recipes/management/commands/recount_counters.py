@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart, User
+from users.models import Subscription
+
+
+def count_subquery(model, field):
+    """Количество строк model, ссылающихся на текущую запись через field."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+# модель -> {счётчик: выражение для пересчёта}
+COUNTERS = {
+    Recipe: {
+        'favorites_count': count_subquery(Favorite, 'recipe'),
+        'shopping_cart_count': count_subquery(ShoppingCart, 'recipe'),
+    },
+    User: {
+        'recipes_count': count_subquery(Recipe, 'author'),
+        'followers_count': count_subquery(Subscription, 'author'),
+    },
+}
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт счётчиков избранного, списков покупок, рецептов '
+            'и подписчиков')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько записей пересчитывать за один запрос')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counters in COUNTERS.items():
+            last_pk = 0
+            processed = 0
+            while True:
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk).order_by(
+                        'pk').values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                model.objects.filter(pk__in=pks).update(**counters)
+                last_pk = pks[-1]
+                processed += len(pks)
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: '
+                    f'пересчитано {processed}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,34 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from recipes.models import MEDIA_FIELDS, MediaFile
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт ссылок на медиафайлы и удаление файлов, '
+            'на которые не ссылается ни одна запись')
+
+    def handle(self, *args, **options):
+        refs = Counter()
+        for model, field in MEDIA_FIELDS:
+            refs.update(dict(
+                model.objects.exclude(**{field: ''}).exclude(
+                    **{f'{field}__isnull': True}
+                ).order_by().values(field).annotate(
+                    total=Count('pk')).values_list(field, 'total')))
+        model, field = MEDIA_FIELDS[0]
+        storage = model._meta.get_field(field).storage
+        fixed = removed = 0
+        for name, stored in MediaFile.objects.values_list(
+                'name', 'refs').iterator():
+            actual = refs.get(name, 0)
+            if actual != stored:
+                MediaFile.objects.filter(name=name).update(refs=actual)
+                fixed += 1
+            if not actual:
+                storage.collect(name)
+                removed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: {fixed}, удалено файлов: {removed}'))
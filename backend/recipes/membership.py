@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.db_router import primary
+from users.models import Subscription
+
+from .models import Favorite, ShoppingCart
+
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+SUBSCRIPTIONS = 'subscriptions'
+
+# вид списка -> загрузка множества id из БД
+LOADERS = {
+    FAVORITES: lambda user_id: Favorite.objects.filter(
+        user_id=user_id).values_list('recipe_id', flat=True),
+    SHOPPING_CART: lambda user_id: ShoppingCart.objects.filter(
+        user_id=user_id).values_list('recipe_id', flat=True),
+    SUBSCRIPTIONS: lambda user_id: Subscription.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True),
+}
+
+
+def _membership_key(kind, user_id):
+    return f'membership:{kind}:{user_id}'
+
+
+def get_member_ids(user_id, kind):
+    """Множество id рецептов (или авторов) из списка пользователя."""
+    key = _membership_key(kind, user_id)
+    ids = cache.get(key)
+    if ids is None:
+        with primary():
+            ids = frozenset(LOADERS[kind](user_id))
+        cache.set(key, ids, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate_member_ids(user_id, kind):
+    # удаляем сразу и ещё раз после коммита: параллельный запрос мог
+    # успеть положить в кэш множество, прочитанное до коммита
+    key = _membership_key(kind, user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -2,8 +2,10 @@ from django.db import models
 
 # Create your models here.
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from foodgram.mixins import QueryUpdatedFieldsMixin
 
 User = get_user_model()
 
@@ -22,6 +24,12 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -54,7 +62,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(QueryUpdatedFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -79,6 +87,7 @@ class Recipe(models.Model):
     )
     tags = models.ManyToManyField(
         Tag,
+        through='RecipeTag',
         verbose_name='Теги'
     )
     cooking_time = models.PositiveSmallIntegerField(
@@ -89,16 +98,96 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    # счётчики поддерживаются сигналами (recipes.signals),
+    # пересчитываются командой recount_counters
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False
+    )
+    # код короткой ссылки, выдаётся при первом запросе (recipes.short_links)
+    short_code = models.CharField(
+        'Код короткой ссылки',
+        max_length=6,
+        unique=True,
+        null=True,
+        editable=False
+    )
+    # заполняется только на Postgres, см. recipes.search
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+
+    # меняются только запросами UPDATE, save() их не пишет
+    query_updated_fields = ('favorites_count', 'shopping_cart_count',
+                            'short_code', 'search_vector')
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # ключ для выдачи ленты курсором, см. api.pagination
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            # рецепты автора (?author=, подписки) в порядке ленты
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeTag(models.Model):
+    # одиночные индексы не нужны: оба поля ведут составные индексы ниже
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_index=False,
+        verbose_name='Рецепт'
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        db_index=False,
+        verbose_name='Тег'
+    )
+
+    class Meta:
+        # таблица прежней автоматической связи Recipe.tags
+        db_table = 'recipes_recipe_tags'
+        verbose_name = 'Тег рецепта'
+        verbose_name_plural = 'Теги рецепта'
+        constraints = [
+            # (recipe, tag) - для EXISTS в фильтре по тегам
+            models.UniqueConstraint(
+                fields=['recipe', 'tag'],
+                name='unique_recipe_tag'
+            )
+        ]
+        indexes = [
+            # (tag, recipe) - когда план начинается с выбранных тегов
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipe_tag_tag_recipe_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.tag} у {self.recipe}'
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -165,6 +254,12 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт',
     )
+    # во сколько раз умножить ингредиенты рецепта в списке покупок
+    portions = models.PositiveSmallIntegerField(
+        'Порции',
+        default=1,
+        validators=[MinValueValidator(1, message='Минимум одна порция')]
+    )
 
     class Meta:
         verbose_name = 'Корзина покупок'
@@ -178,3 +273,103 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user.username} добавил {self.recipe.name} в корзину'
+
+
+class ShoppingListItem(models.Model):
+    """Итог по ингредиенту в списке покупок, см. recipes.shopping_cart."""
+    # отдельный индекс не нужен: user ведёт уникальный индекс
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    # в единицах ингредиента; похожие единицы сводятся при выгрузке
+    amount = models.IntegerField(
+        'Количество',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} — {self.amount} у {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, см. recipes.feed."""
+    # отдельный индекс не нужен: user ведёт составные индексы ниже
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    # копия Recipe.pub_date: лента листается по индексу этой таблицы
+    pub_date = models.DateTimeField(
+        'Дата публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class MediaFile(models.Model):
+    """Число ссылок на файл в хранилище, см. foodgram.storage."""
+    name = models.CharField(
+        'Файл',
+        max_length=255,
+        primary_key=True
+    )
+    refs = models.PositiveIntegerField(
+        'Ссылок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return self.name
+
+
+# поля, ссылки из которых на файлы хранилища считает MediaFile
+MEDIA_FIELDS = ((Recipe, 'image'), (User, 'avatar'))
@@ -0,0 +1,138 @@
+import re
+from bisect import bisect_left
+from threading import Lock
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from foodgram.db_router import primary
+
+from .models import Recipe
+from .versions import RECIPES, get_version
+
+SEARCH_CONFIG = 'russian'
+
+TOKEN_RE = re.compile(r'\w+')
+
+# индексы создаются после migrate (см. recipes.signals): миграции
+# генерируются при деплое, а на SQLite GIN-индексов нет
+POSTGRES_SEARCH_SETUP = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+    'ON recipes_recipe USING gin (name gin_trgm_ops)',
+)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold().replace('ё', 'е'))
+
+
+def search_vector():
+    # название весит больше описания
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG))
+
+
+def update_search_vectors(pks=None, using='default'):
+    """Пересчитывает сохранённый search_vector; без pks - где он пуст."""
+    if connections[using].vendor != 'postgresql':
+        return
+    queryset = Recipe.objects.using(using)
+    if pks is None:
+        queryset = queryset.filter(search_vector=None)
+    else:
+        queryset = queryset.filter(pk__in=pks)
+    queryset.update(search_vector=search_vector())
+
+
+class RecipeSearchIndex:
+    """Обратный индекс по словам названий и описаний рецептов.
+
+    Используется вместо полнотекстового поиска Postgres, когда проект
+    работает на SQLite. Перестраивается при смене версии рецептов.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._name = ([], [])
+        self._text = ([], [])
+
+    @staticmethod
+    def _freeze(index):
+        keys = sorted(index)
+        return keys, [index[key] for key in keys]
+
+    def _build(self, version):
+        name_index, text_index = {}, {}
+        with primary():
+            rows = Recipe.objects.values_list('id', 'name', 'text')
+            for pk, name, text in rows.iterator():
+                for token in tokenize(name):
+                    name_index.setdefault(token, set()).add(pk)
+                for token in tokenize(text):
+                    text_index.setdefault(token, set()).add(pk)
+        self._name = self._freeze(name_index)
+        self._text = self._freeze(text_index)
+        self._version = version
+
+    def _ensure_built(self):
+        version = get_version(RECIPES)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build(version)
+
+    @staticmethod
+    def _match(index, token):
+        """Рецепты со словами, начинающимися с token."""
+        keys, ids = index
+        found = set()
+        position = bisect_left(keys, token)
+        while position < len(keys) and keys[position].startswith(token):
+            found |= ids[position]
+            position += 1
+        return found
+
+    def search(self, query):
+        """Возвращает id совпавших по названию и по описанию рецептов."""
+        tokens = tokenize(query)
+        if not tokens:
+            return set(), set()
+        self._ensure_built()
+        by_name = by_any = None
+        for token in tokens:
+            name_ids = self._match(self._name, token)
+            any_ids = name_ids | self._match(self._text, token)
+            by_name = name_ids if by_name is None else by_name & name_ids
+            by_any = any_ids if by_any is None else by_any & any_ids
+        return by_name, by_any - by_name
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по запросу, совпадения в названии идут первыми."""
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.annotate(
+            search_rank=SearchRank(F('search_vector'), search_query),
+            similarity=TrigramSimilarity('name', query),
+        ).filter(
+            Q(search_vector=search_query) | Q(name__trigram_similar=query)
+        ).order_by('-search_rank', '-similarity', '-pub_date', '-id')
+
+    by_name, by_text = recipe_search_index.search(query)
+    return queryset.filter(id__in=by_name | by_text).annotate(
+        search_rank=Case(
+            When(id__in=by_name, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank', '-pub_date', '-id')
@@ -0,0 +1,136 @@
+"""Список покупок, который поддерживается при изменении корзины.
+
+Для каждого пользователя в ShoppingListItem хранится сумма каждого
+ингредиента по рецептам корзины с учётом порций. Добавление и удаление
+рецепта, смена порций и правка ингредиентов рецепта меняют суммы на
+разницу, поэтому выгрузка списка - это чтение строк пользователя.
+Команда rebuild_shopping_lists пересчитывает суммы с нуля.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem, User
+
+# единица -> (единица, в которой выводится сумма, множитель)
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def recipe_amounts(recipe_id):
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def _lock(user_id):
+    # строка пользователя - замок его списка покупок: иначе вставка,
+    # прибавка и удаление обнулённых строк двух параллельных изменений
+    # перемешиваются, и прибавка к строке, которую удалила другая
+    # транзакция, теряется
+    list(User.objects.select_for_update().filter(
+        pk=user_id).values_list('pk', flat=True))
+
+
+@transaction.atomic
+def apply(user_id, deltas):
+    """Прибавляет к суммам пользователя {ingredient_id: разница}."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    _lock(user_id)
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+        for ingredient_id, delta in deltas.items() if delta > 0
+    ], ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id=user_id, ingredient_id__in=deltas)
+    items.update(amount=F('amount') + Case(
+        *(When(ingredient_id=ingredient_id, then=Value(delta))
+          for ingredient_id, delta in deltas.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+    items.filter(amount__lte=0).delete()
+
+
+def _scaled(amounts, portions):
+    return {key: amount * portions for key, amount in amounts.items()}
+
+
+def add_recipe(cart_item):
+    apply(cart_item.user_id, _scaled(
+        recipe_amounts(cart_item.recipe_id), cart_item.portions))
+
+
+def remove_recipe(cart_item):
+    apply(cart_item.user_id, _scaled(
+        recipe_amounts(cart_item.recipe_id), -cart_item.portions))
+
+
+@transaction.atomic
+def set_portions(cart_item, portions):
+    # строка корзины блокируется, чтобы параллельные изменения
+    # не посчитали разницу от одного и того же старого значения
+    old = ShoppingCart.objects.select_for_update().values_list(
+        'portions', flat=True).get(pk=cart_item.pk)
+    cart_item.portions = portions
+    ShoppingCart.objects.filter(pk=cart_item.pk).update(portions=portions)
+    apply(cart_item.user_id, _scaled(
+        recipe_amounts(cart_item.recipe_id), portions - old))
+
+
+def recipe_ingredients_changed(recipe_id, deltas):
+    """Переносит изменение ингредиентов рецепта в списки покупок."""
+    if not any(deltas.values()):
+        return
+    # пользователи по порядку id: замки _lock берутся в одном порядке
+    for user_id, portions in ShoppingCart.objects.filter(
+            recipe_id=recipe_id).order_by('user_id').values_list(
+            'user_id', 'portions'):
+        apply(user_id, _scaled(deltas, portions))
+
+
+def recompute(user_id):
+    """Суммы пользователя, посчитанные заново по корзине."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe__shopping_cart__user_id=user_id
+    ).values('ingredient_id').annotate(
+        total=Sum(F('amount') * F('recipe__shopping_cart__portions'))
+    ).values_list('ingredient_id', 'total'))
+
+
+@transaction.atomic
+def rebuild(user_id):
+    _lock(user_id)
+    ShoppingListItem.objects.filter(user_id=user_id).delete()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+        for ingredient_id, amount in recompute(user_id).items()
+    ])
+
+
+def _normalized(name, totals):
+    for unit, amount in totals.items():
+        yield {
+            'ingredient__name': name,
+            'ingredient__measurement_unit': unit,
+            'amount': amount,
+        }
+
+
+def shopping_list(user):
+    """Строки списка покупок; граммы и килограммы (мл и л) сводятся."""
+    rows = ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).values_list('ingredient__name', 'ingredient__measurement_unit',
+                  'amount')
+    current, totals = None, {}
+    for name, unit, amount in rows.iterator():
+        if name != current:
+            yield from _normalized(current, totals)
+            current, totals = name, {}
+        unit, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+        totals[unit] = totals.get(unit, 0) + amount * factor
+    yield from _normalized(current, totals)
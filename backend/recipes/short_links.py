@@ -0,0 +1,67 @@
+from string import ascii_letters, digits
+
+from django.conf import settings
+from django.core.cache import cache
+from foodgram.lru import LRUCache
+
+from .models import Recipe
+
+ALPHABET = digits + ascii_letters
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+# взаимно просто с 62 ** 6: pk -> код взаимно однозначно, соседние
+# рецепты получают непохожие коды
+MULTIPLIER = 2654435761
+
+
+def encode(pk):
+    """Код короткой ссылки для рецепта: base62 от перемешанного pk."""
+    number = pk * MULTIPLIER % CODE_SPACE
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, remainder = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def get_short_code(recipe):
+    """Возвращает код рецепта, при первом обращении сохраняя его.
+
+    Код вычисляется из pk, поэтому параллельные запросы пишут одно и то
+    же значение, а условие short_code=None делает запись однократной.
+    """
+    if recipe.short_code is None:
+        recipe.short_code = encode(recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk, short_code=None).update(
+            short_code=recipe.short_code)
+    return recipe.short_code
+
+
+local_links = LRUCache(settings.SHORT_LINK_LRU_SIZE)
+
+
+def _short_link_key(code):
+    return f'short_link:{code}'
+
+
+def resolve(code):
+    """id рецепта по коду: память воркера, общий кэш, затем БД."""
+    recipe_id = local_links.get(code)
+    if recipe_id is not None:
+        return recipe_id
+    key = _short_link_key(code)
+    recipe_id = cache.get(key)
+    if recipe_id is None:
+        recipe_id = Recipe.objects.filter(short_code=code).values_list(
+            'id', flat=True).first()
+        if recipe_id is None:
+            return None
+        # код рецепта не меняется, запись живёт до удаления рецепта
+        cache.set(key, recipe_id, timeout=None)
+    local_links.set(code, recipe_id)
+    return recipe_id
+
+
+def forget(code):
+    cache.delete(_short_link_key(code))
+    local_links.pop(code)
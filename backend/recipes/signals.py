@@ -0,0 +1,201 @@
+from django.db.models import F
+from django.db import connections
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_migrate, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from users.models import Subscription
+
+from . import feed, shopping_cart
+from .membership import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS,
+                         invalidate_member_ids)
+from .models import (MEDIA_FIELDS, Favorite, Ingredient, Recipe, RecipeTag,
+                     ShoppingCart, Tag, User)
+from .search import POSTGRES_SEARCH_SETUP, update_search_vectors
+from .short_links import forget, get_short_code
+from .versions import (INGREDIENTS, RECIPES, TAGS, bump_recipe_versions,
+                       bump_version)
+
+
+# Версии справочников входят в ключ кэша карточки рецепта, поэтому
+# карточки сбрасываются вместе со справочником, без обхода рецептов.
+# Удаление ловим в pre_delete, пока связи с рецептами ещё не удалены.
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_ingredients_version(sender, instance, **kwargs):
+    bump_version(INGREDIENTS)
+    if Recipe.objects.filter(ingredients=instance).exists():
+        bump_version(RECIPES)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def bump_tags_version(sender, instance, **kwargs):
+    bump_version(TAGS)
+    if Recipe.objects.filter(tags=instance).exists():
+        bump_version(RECIPES)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    bump_recipe_versions([instance.id])
+
+
+@receiver(m2m_changed, sender=RecipeTag)
+def recipe_tags_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        bump_recipe_versions([instance.id])
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    # вход пользователя обновляет только last_login, это не профиль
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_recipe_versions(Recipe.objects.filter(
+        author=instance).values_list('id', flat=True))
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик через F(), не опускаясь ниже нуля."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+        invalidate_member_ids(instance.user_id, FAVORITES)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+    invalidate_member_ids(instance.user_id, FAVORITES)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', 1)
+        invalidate_member_ids(instance.user_id, SHOPPING_CART)
+        shopping_cart.add_recipe(instance)
+
+
+# при удалении рецепта его ингредиенты нужны ещё до удаления связей
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removing(sender, instance, **kwargs):
+    shopping_cart.remove_recipe(instance)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', -1)
+    invalidate_member_ids(instance.user_id, SHOPPING_CART)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_member_ids(instance.user_id, SUBSCRIPTIONS)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    was_push = feed.is_push_author(instance.author_id, lock=True)
+    change_counter(User, instance.author_id, 'followers_count', -1)
+    feed.remove(instance.user_id, instance.author_id)
+    if not was_push and feed.is_push_author(instance.author_id):
+        feed.restore_push(instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        # код выдаём сразу, пока экземпляр не успели загрузить без него
+        get_short_code(instance)
+        feed.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    if instance.short_code:
+        forget(instance.short_code)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_text_changed(sender, instance, using, update_fields=None,
+                        **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    update_search_vectors([instance.id], using=using)
+
+
+@receiver(post_migrate)
+def setup_search(sender, using, **kwargs):
+    """Создаёт GIN-индексы поиска и заполняет пустые search_vector."""
+    if sender.name != 'recipes' or connections[using].vendor != 'postgresql':
+        return
+    with connections[using].cursor() as cursor:
+        for statement in POSTGRES_SEARCH_SETUP:
+            cursor.execute(statement)
+    update_search_vectors(using=using)
+
+
+def remember_loaded_file(sender, instance, **kwargs):
+    field = dict(MEDIA_FIELDS)[sender]
+    # имя файла записи из БД; only()/defer() могли его не загрузить
+    if instance.pk is not None and field in instance.__dict__:
+        instance._loaded_file = instance.__dict__[field]
+
+
+def remember_file(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежний файл записи, чтобы освободить его после замены."""
+    field = dict(MEDIA_FIELDS)[sender]
+    if instance.pk is None or update_fields and field not in update_fields:
+        return
+    file = getattr(instance, field)
+    # поле не меняли после загрузки - запрос прежнего имени не нужен
+    if file._committed and file.name == instance.__dict__.get(
+            '_loaded_file', ...):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list(
+        field, flat=True).first()
+    # новая загрузка добавит ссылку, даже если содержимое то же самое
+    if previous and (previous != file.name or file and not file._committed):
+        instance._previous_file = previous
+
+
+def release_replaced_file(sender, instance, **kwargs):
+    field = getattr(instance, dict(MEDIA_FIELDS)[sender])
+    instance._loaded_file = field.name
+    previous = instance.__dict__.pop('_previous_file', None)
+    if previous:
+        field.storage.delete(previous)
+
+
+def release_file(sender, instance, **kwargs):
+    field = getattr(instance, dict(MEDIA_FIELDS)[sender])
+    if field.name:
+        field.storage.delete(field.name)
+
+
+for model, _ in MEDIA_FIELDS:
+    post_init.connect(remember_loaded_file, sender=model)
+    pre_save.connect(remember_file, sender=model)
+    post_save.connect(release_replaced_file, sender=model)
+    post_delete.connect(release_file, sender=model)
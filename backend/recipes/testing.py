@@ -0,0 +1,51 @@
+"""Общие данные для тестов api и recipes."""
+from django.core.cache import cache
+
+from .models import Ingredient, Recipe, RecipeIngredient, Tag, User
+
+# картинка 1x1 для полей Base64ImageField
+PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+       'AAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+class RecipeDataMixin:
+    """Пользователь, автор, теги, ингредиенты и фабрика рецептов."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('user')
+        self.author = self.create_user('author')
+        self.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}')
+            for i in range(3)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            first_name='Имя', last_name='Фамилия', password='Pass-12345')
+
+    def create_recipe(self, author, name='Рецепт', tags=None, amounts=None):
+        """Рецепт с тегами и ингредиентами {номер ингредиента: количество}.
+
+        По умолчанию - первые два тега и первые три ингредиента по 10.
+        """
+        recipe = Recipe.objects.create(
+            author=author, name=name, image='recipes/images/test.png',
+            text='Текст', cooking_time=5)
+        recipe.tags.set(self.tags[:2] if tags is None else tags)
+        if amounts is None:
+            amounts = dict.fromkeys(range(3), 10)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=self.ingredients[i],
+                             amount=amount)
+            for i, amount in amounts.items()
+        ])
+        return recipe
@@ -1,3 +1,282 @@
-from django.test import TestCase
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from users.models import Subscription
+
+from .feed import feed_recipe_ids
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, User)
+from .shopping_cart import rebuild, recompute, shopping_list
+from .testing import PNG, RecipeDataMixin
+from .versions import RECIPES, get_version, recipe_version_name
+
+
+class QueryUpdatedFieldsTest(RecipeDataMixin, TestCase):
+    """save() устаревшего экземпляра не затирает счётчики."""
+
+    def test_stale_user_save(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.create_recipe(self.author)
+        stale.first_name = 'Новое имя'
+        stale.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.first_name, 'Новое имя')
+        self.assertEqual(
+            (self.author.followers_count, self.author.recipes_count), (1, 1))
+
+    def test_stale_recipe_save(self):
+        recipe = self.create_recipe(self.author)
+        stale = Recipe.objects.get(pk=recipe.pk)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(short_code='abcdef')
+        stale.name = 'Новое название'
+        stale.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(
+            (recipe.favorites_count, recipe.shopping_cart_count,
+             recipe.short_code), (1, 1, 'abcdef'))
+
+    def test_api_saves(self):
+        """Аватар, пароль и PATCH рецепта сохраняют счётчики."""
+        recipe = self.create_recipe(self.author)
+        client = APIClient()
+        client.force_authenticate(self.author)
+        client.get('/api/users/me/')
+        Subscription.objects.create(user=self.user, author=self.author)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+
+        response = client.put(
+            '/api/users/me/avatar/', {'avatar': PNG}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = client.post('/api/users/set_password/', {
+            'current_password': 'Pass-12345',
+            'new_password': 'New-pass-12345'})
+        self.assertEqual(response.status_code, 204)
+        response = client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': 'Новое название', 'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 5}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.author.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(recipe.favorites_count, 1)
+
+
+class RecipeVersionsTest(RecipeDataMixin, TestCase):
+    """Сохранение пользователя сбрасывает кэш только его рецептов."""
+
+    def test_user_without_recipes(self):
+        version = get_version(RECIPES)
+        self.create_user('new')
+        self.user.set_password('New-pass-12345')
+        self.user.save()
+        self.assertEqual(get_version(RECIPES), version)
+
+    def test_author(self):
+        recipe = self.create_recipe(self.author)
+        versions = get_version(RECIPES), get_version(
+            recipe_version_name(recipe.id))
+        self.author.first_name = 'Новое имя'
+        self.author.save()
+        self.assertNotEqual(get_version(RECIPES), versions[0])
+        self.assertNotEqual(
+            get_version(recipe_version_name(recipe.id)), versions[1])
+
+    def test_tag_rename(self):
+        """Карточки сбрасываются без обхода рецептов тега."""
+        recipes = [self.create_recipe(self.author) for _ in range(5)]
+        client = APIClient()
+        url = f'/api/recipes/{recipes[0].id}/'
+        client.get(url)
+        self.assertEqual(client.get(url)['X-Cache'], 'HIT')
+        tag = self.tags[0]
+        tag.name = 'Новый тег'
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            tag.save()
+        # версии тегов и ленты
+        self.assertEqual(incr.call_count, 2)
+        response = client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['tags'][0]['name'], 'Новый тег')
+        self.assertEqual(
+            client.get('/api/recipes/').data['results'][0]['tags'][0]['name'],
+            'Новый тег')
+
+    def test_unused_ingredient(self):
+        self.create_recipe(self.author)
+        version = get_version(RECIPES)
+        self.ingredients[4].name = 'Другое название'
+        self.ingredients[4].save()
+        self.assertEqual(get_version(RECIPES), version)
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=2)
+class FeedModeTest(RecipeDataMixin, TestCase):
+    """Лента не теряет рецепты, когда автор меняет режим раскладки."""
+
+    def setUp(self):
+        super().setUp()
+        self.followers = [self.user] + [
+            self.create_user(f'follower{i}') for i in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for follower in self.followers:
+                Subscription.objects.create(user=follower, author=self.author)
+
+    def assert_in_feeds(self, recipe, users):
+        for user in users:
+            self.assertIn(recipe.id, feed_recipe_ids(user))
+
+    def test_back_to_push_after_unsubscribe(self):
+        # три подписчика > 2: рецепт не раскладывается
+        recipe = self.create_recipe(self.author)
+        self.assert_in_feeds(recipe, self.followers)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.followers[2]).delete()
+        self.assert_in_feeds(recipe, self.followers[:2])
+        self.assertNotIn(recipe.id, feed_recipe_ids(self.followers[2]))
+
+    def test_back_to_push_after_follower_deleted(self):
+        recipe = self.create_recipe(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.followers[2].delete()
+        self.assert_in_feeds(recipe, self.followers[:2])
+
+    def test_to_pull_and_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.followers[2]).delete()
+        pushed = self.create_recipe(self.author)
+        Subscription.objects.create(user=self.followers[2], author=self.author)
+        pulled = self.create_recipe(self.author)
+        self.assertEqual(feed_recipe_ids(self.followers[0]),
+                         [pulled.id, pushed.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.followers[1]).delete()
+        self.assertEqual(feed_recipe_ids(self.followers[0]),
+                         [pulled.id, pushed.id])
+
+    def test_author_deleted(self):
+        self.create_recipe(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.delete()
+        self.assertEqual(feed_recipe_ids(self.user), [])
+
+
+class ShoppingListTest(RecipeDataMixin, TestCase):
+    """Суммы списка покупок всегда равны пересчитанным по корзине."""
+
+    def assert_aggregates(self, users):
+        for user in users:
+            self.assertEqual(
+                dict(ShoppingListItem.objects.filter(user=user).values_list(
+                    'ingredient_id', 'amount')),
+                recompute(user.id))
+
+    def random_ingredients(self, rng):
+        return {
+            number: rng.randint(1, 50)
+            for number in rng.sample(range(len(self.ingredients)),
+                                     rng.randint(1, len(self.ingredients)))
+        }
+
+    def test_random_changes(self):
+        rng = random.Random(1)
+        users = [self.user, self.author, self.create_user('third')]
+        clients = {}
+        for user in users:
+            clients[user.id] = APIClient()
+            clients[user.id].force_authenticate(user)
+        recipes = [self.create_recipe(
+            rng.choice(users), amounts=self.random_ingredients(rng))
+            for _ in range(6)]
+
+        for _ in range(200):
+            user = rng.choice(users)
+            recipe = rng.choice(recipes)
+            url = f'/api/recipes/{recipe.id}/shopping_cart/'
+            operation = rng.random()
+            if operation < 0.35:
+                clients[user.id].post(
+                    url, {'portions': rng.randint(1, 4)}, format='json')
+            elif operation < 0.55:
+                clients[user.id].delete(url)
+            elif operation < 0.7:
+                clients[user.id].patch(
+                    url, {'portions': rng.randint(1, 5)}, format='json')
+            elif operation < 0.9:
+                response = clients[recipe.author_id].patch(
+                    f'/api/recipes/{recipe.id}/', {
+                        'tags': [self.tags[0].id],
+                        'ingredients': [
+                            {'id': self.ingredients[number].id,
+                             'amount': amount}
+                            for number, amount
+                            in self.random_ingredients(rng).items()
+                        ],
+                    }, format='json')
+                self.assertEqual(response.status_code, 200)
+            elif operation < 0.95 and len(recipes) > 3:
+                recipes.remove(recipe)
+                recipe.delete()
+            else:
+                recipes.append(self.create_recipe(
+                    rng.choice(users), amounts=self.random_ingredients(rng)))
+            self.assert_aggregates(users)
+
+        self.assertTrue(ShoppingListItem.objects.exists())
+        self.ingredients[0].delete()
+        self.assert_aggregates(users)
+        for user in users:
+            expected = recompute(user.id)
+            rebuild(user.id)
+            self.assertEqual(
+                dict(ShoppingListItem.objects.filter(user=user).values_list(
+                    'ingredient_id', 'amount')), expected)
+
+    def test_portions(self):
+        recipe = self.create_recipe(self.author, amounts={0: 10})
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        response = client.post(url, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            ShoppingCart.objects.get(user=self.user).portions, 1)
+        response = client.patch(url, {'portions': 3}, format='json')
+        self.assertEqual(response.data, {'portions': 3})
+        # PATCH без числа порций - ошибка, а не сброс к одной порции
+        for data in ({}, {'portions': 0}):
+            response = client.patch(url, data, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('portions', response.data)
+        self.assertEqual(
+            ShoppingCart.objects.get(user=self.user).portions, 3)
+        self.assert_aggregates([self.user])
+
+    def test_units_are_merged(self):
+        kilograms = Ingredient.objects.create(
+            name='Ингредиент 0', measurement_unit='кг')
+        litres = Ingredient.objects.create(name='Вода', measurement_unit='л')
+        millilitres = Ingredient.objects.create(
+            name='Вода', measurement_unit='мл')
+        recipe = self.create_recipe(self.author, amounts={0: 300})
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=kilograms, amount=2),
+            RecipeIngredient(recipe=recipe, ingredient=litres, amount=1),
+            RecipeIngredient(recipe=recipe, ingredient=millilitres,
+                             amount=250),
+        ])
+        ShoppingCart.objects.create(user=self.user, recipe=recipe, portions=2)
+        self.assertEqual(list(shopping_list(self.user)), [
+            {'ingredient__name': 'Вода',
+             'ingredient__measurement_unit': 'мл', 'amount': 2500},
+            {'ingredient__name': 'Ингредиент 0',
+             'ingredient__measurement_unit': 'г', 'amount': 4600},
+        ])
@@ -0,0 +1,52 @@
+import time
+
+from django.core.cache import cache
+
+# справочники и данные, для которых ведётся счётчик версий
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+RECIPES = 'recipes'
+
+
+def _version_key(name):
+    return f'{name}_version'
+
+
+def recipe_version_name(pk):
+    return f'recipe_{pk}'
+
+
+def get_version(name):
+    # начальное значение - текущее время: если ключ вытеснят из кэша,
+    # новая версия не совпадёт ни с одной из уже выданных
+    return cache.get_or_set(
+        _version_key(name), int(time.time() * 1000), timeout=None)
+
+
+def get_versions(*names):
+    """Версии нескольких счётчиков за одно обращение к кэшу."""
+    versions = cache.get_many([_version_key(name) for name in names])
+    return tuple(
+        versions.get(_version_key(name)) or get_version(name)
+        for name in names)
+
+
+def bump_version(name):
+    """Помечает все закэшированные данные устаревшими."""
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        get_version(name)
+
+
+def bump_recipe_versions(pks):
+    """Сбрасывает кэш ленты и перечисленных рецептов.
+
+    Без рецептов версия ленты не меняется: иначе, например, сохранение
+    пользователя без рецептов сбрасывало бы кэш ленты во всех воркерах.
+    """
+    pks = list(pks)
+    if pks:
+        bump_version(RECIPES)
+    for pk in pks:
+        bump_version(recipe_version_name(pk))
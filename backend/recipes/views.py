@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponseRedirect
 
-# Create your views here.
+from .short_links import resolve
+
+
+def short_link_redirect(request, code):
+    """Переход по короткой ссылке на страницу рецепта во фронтенде."""
+    recipe_id = resolve(code)
+    if recipe_id is None:
+        raise Http404
+    return HttpResponseRedirect(f'/recipes/{recipe_id}/')
@@ -3,9 +3,10 @@ from django.db import models
 # Create your models here.
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from foodgram.mixins import QueryUpdatedFieldsMixin
 
 
-class User(AbstractUser):
+class User(QueryUpdatedFieldsMixin, AbstractUser):
     email = models.EmailField(
         'email address',
         unique=True,
@@ -25,6 +26,19 @@ class User(AbstractUser):
         null=True,
         blank=True
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
+
+    # счётчики меняют сигналы recipes.signals, save() их не пишет
+    query_updated_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']